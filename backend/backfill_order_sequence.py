@@ -1,20 +1,9 @@
-import mysql.connector
 from datetime import datetime, timedelta
 import math
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from rollups import refresh_rollups
+from db import get_db_connection
 
 def backfill_sequence_and_plan():
     conn = get_db_connection()
@@ -206,6 +195,8 @@ def backfill_sequence_and_plan():
             print(f"  Updated {total_updates} rows...")
             
         print(f"Backfill Complete. Updated {total_updates} rows.")
+        refresh_rollups(conn)
+        bump_data_version(conn)
         print(f"Time: {time.time() - start_ts:.2f}s")
 
     except Exception as e:
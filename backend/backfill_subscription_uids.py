@@ -1,18 +1,7 @@
-import mysql.connector
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from hll_sketches import refresh_sketches
+from db import get_db_connection
 
 def backfill_uids_refined():
     conn = get_db_connection()
@@ -98,6 +87,8 @@ def backfill_uids_refined():
             updated_count += len(batch_data)
         
         end_ts = time.time()
+        # user_uid feeds the subscription sketches
+        refresh_sketches(conn, bump_data_version(conn), tables=["Fact_Subscription"])
         print(f"Backfill Complete. Updated {updated_count} subscriptions with UIDs.")
         print(f"Time taken: {end_ts - start_ts:.2f} seconds")
 
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+from query_cache import normalize_filters
+
+# Background warm-up of the report result cache.
+# After startup and whenever the data version changes (ETL scripts,
+# /api/etl/execute) every saved report's default query is run, plus the filter
+# combinations analysts used most recently, so dashboards open on a warm cache.
+# Runs on its own small pool and backs off while user queries are busy.
+
+WARMUP_CONCURRENCY = 2
+# Most used filter combinations warmed per report
+WARMUP_TOP_QUERIES_PER_REPORT = 3
+USAGE_WINDOW_DAYS = 14
+USAGE_FLUSH_SECONDS = 60
+# Re-warm at least this often, warmed results are cached for WARMUP_TTL_SECONDS
+WARMUP_TTL_SECONDS = 6 * 3600
+WARMUP_INTERVAL_SECONDS = WARMUP_TTL_SECONDS - 600
+WARMUP_POLL_SECONDS = 5.0
+# Wait while this many user report statements are running
+BUSY_QUERY_THRESHOLD = 4
+BUSY_WAIT_SECONDS = 1.0
+MAX_BUSY_WAIT_SECONDS = 60.0
+
+USAGE_TABLE = "bi_query_usage"
+
+def ensure_usage_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {USAGE_TABLE} (
+            report_id VARCHAR(255) NOT NULL,
+            query_hash CHAR(40) NOT NULL,
+            query_json TEXT NOT NULL,
+            hits BIGINT NOT NULL,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (report_id, query_hash),
+            KEY idx_last_used (last_used)
+        )
+    """)
+
+class QueryUsage:
+    # Counts /api/query requests in memory; flushed to bi_query_usage by the warmer
+    def __init__(self):
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+
+    def flush_due(self) -> bool:
+        return bool(self._counts) and time.monotonic() - self.flushed_at > USAGE_FLUSH_SECONDS
+
+    def record(self, report_id: str, filters: Dict, granularity: str):
+        if not any((filters or {}).values()) and granularity == "day":
+            # The default query is always warmed anyway
+            return
+        payload = json.dumps({"filters": json.loads(normalize_filters(filters)), "granularity": granularity}, sort_keys=True)
+        with self._lock:
+            key = (report_id, payload)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def flush(self, conn):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self.flushed_at = time.monotonic()
+        if not counts:
+            return
+        cursor = conn.cursor()
+        try:
+            ensure_usage_table(cursor)
+            cursor.executemany(f"""
+                INSERT INTO {USAGE_TABLE} (report_id, query_hash, query_json, hits) VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE hits = hits + VALUES(hits), last_used = CURRENT_TIMESTAMP
+            """, [
+                (report_id, hashlib.sha1(payload.encode()).hexdigest(), payload, hits)
+                for (report_id, payload), hits in counts.items()
+            ])
+            conn.commit()
+        finally:
+            cursor.close()
+
+    def top_queries(self, conn, per_report: int) -> List[Tuple[str, Dict]]:
+        cursor = conn.cursor()
+        try:
+            ensure_usage_table(cursor)
+            cursor.execute(f"""
+                SELECT report_id, query_json FROM (
+                    SELECT report_id, query_json,
+                           ROW_NUMBER() OVER (PARTITION BY report_id ORDER BY hits DESC) AS rn
+                    FROM {USAGE_TABLE}
+                    WHERE last_used >= NOW() - INTERVAL %s DAY
+                ) ranked
+                WHERE rn <= %s
+            """, (USAGE_WINDOW_DAYS, per_report))
+            return [(report_id, json.loads(payload)) for report_id, payload in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+class CacheWarmer:
+    # list_queries() -> queries to warm; warm(query) computes and caches one of
+    # them; on_poll() runs on every poll (flushing usage counts)
+    def __init__(self, current_version: Callable[[], int], list_queries: Callable[[], List[Any]],
+                 warm: Callable[[Any], None], on_poll: Optional[Callable[[], None]] = None):
+        self.current_version = current_version
+        self.list_queries = list_queries
+        self.warm = warm
+        self.on_poll = on_poll
+        self.warmed_version = None
+        self.warmed_at = 0.0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="bi-cache-warmup", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                if self.on_poll:
+                    self.on_poll()
+                version = self.current_version()
+                if version != self.warmed_version or time.monotonic() - self.warmed_at > WARMUP_INTERVAL_SECONDS:
+                    self.run(version)
+            except Exception as e:
+                print(f"Warning: Cache warm-up failed: {e}")
+            time.sleep(WARMUP_POLL_SECONDS)
+
+    def _wait_until_idle(self):
+        waited = 0.0
+        while metrics.mysql_in_flight.value("query") >= BUSY_QUERY_THRESHOLD and waited < MAX_BUSY_WAIT_SECONDS:
+            time.sleep(BUSY_WAIT_SECONDS)
+            waited += BUSY_WAIT_SECONDS
+
+    def _warm_one(self, version: int, query) -> bool:
+        # Newer data arrived: stop, the next pass warms that version
+        if self.current_version() != version:
+            return False
+        self._wait_until_idle()
+        try:
+            self.warm(query)
+            return True
+        except Exception as e:
+            print(f"Warning: Cache warm-up of {getattr(query, 'report_id', query)} failed: {getattr(e, 'detail', e)}")
+            return False
+
+    def run(self, version: int):
+        start_ts = time.time()
+        queries = self.list_queries()
+        with ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY, thread_name_prefix="bi-warmup") as pool:
+            done = sum(pool.map(lambda q: self._warm_one(version, q), queries))
+        print(f"Cache warm-up for data version {version}: {done}/{len(queries)} queries in {time.time() - start_ts:.1f}s")
+        if self.current_version() == version:
+            self.warmed_version = version
+            self.warmed_at = time.monotonic()
@@ -1,17 +1,8 @@
-import mysql.connector
 import csv
-
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
+from db import get_db_connection
 
 def check_missing_uids():
-    conn = mysql.connector.connect(**DB_CONFIG)
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     print("Checking for UIDs in Fact_Order that are missing in Dim_User AND have cny_amount > 0...")
@@ -0,0 +1,214 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import List, Optional, Set, Tuple
+
+from data_version import carries_forward
+
+# Optional file-backed DuckDB mirror of the Fact_* / Dim_* tables.
+# ETL scripts rebuild it after loading (refresh_mirror); the API answers
+# compatible report SQL from it while its data version matches MySQL's, and
+# falls back to MySQL for anything else. MySQL stays the source of truth:
+# a sample of mirror answers is re-run there and compared.
+# Needs `pip install duckdb`; everything here is a no-op without it.
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+MIRROR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bi_mirror.duckdb")
+MIRROR_TABLE_PREFIXES = ("Fact_", "Dim_")
+COPY_BATCH_SIZE = 50_000
+STATE_TABLE = "_mirror_state"
+
+# Functions and keywords report SQL may use and still mean the same in DuckDB
+ALLOWED_CALLS = {
+    "SUM", "COUNT", "AVG", "MIN", "MAX", "DATE_FORMAT", "COALESCE", "ROUND", "ABS", "DISTINCT",
+    "IN", "AND", "OR", "NOT", "AS", "ON", "WHERE", "THEN", "ELSE", "WHEN",
+}
+
+def mirror_available() -> bool:
+    return duckdb is not None
+
+def _duckdb_type(data_type: str, precision, scale) -> str:
+    data_type = data_type.lower()
+    if data_type in ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"):
+        return "BIGINT"
+    if data_type in ("decimal", "numeric"):
+        if precision and int(precision) <= 38:
+            return f"DECIMAL({int(precision)},{int(scale or 0)})"
+        return "DOUBLE"
+    if data_type in ("float", "double", "real"):
+        return "DOUBLE"
+    if data_type in ("datetime", "timestamp"):
+        return "TIMESTAMP"
+    if data_type == "date":
+        return "DATE"
+    return "VARCHAR"
+
+def mirrored_tables(conn) -> List[str]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT TABLE_NAME FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+        """)
+        return sorted(row[0] for row in cursor.fetchall() if row[0].startswith(MIRROR_TABLE_PREFIXES))
+    finally:
+        cursor.close()
+
+def _copy_table(conn, target, table_name: str):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_PRECISION, NUMERIC_SCALE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (table_name,))
+        columns = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    column_defs = ", ".join(f'"{name}" {_duckdb_type(data_type, p, s)}' for name, data_type, p, s in columns)
+    target.execute(f'CREATE TABLE "{table_name}" ({column_defs})')
+
+    # Unbuffered read: one batch in memory at a time
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(f"SELECT {', '.join(f'`{c[0]}`' for c in columns)} FROM `{table_name}`")
+        placeholders = ", ".join(["?"] * len(columns))
+        while True:
+            rows = cursor.fetchmany(COPY_BATCH_SIZE)
+            if not rows:
+                break
+            if pyarrow is not None:
+                batch = pyarrow.table({
+                    c[0]: [v.decode(errors="replace") if isinstance(v, bytes) else v for v in values]
+                    for c, values in zip(columns, zip(*rows))
+                })
+                target.register("_mirror_batch", batch)
+                target.execute(f'INSERT INTO "{table_name}" SELECT * FROM _mirror_batch')
+                target.unregister("_mirror_batch")
+            else:
+                target.executemany(f'INSERT INTO "{table_name}" VALUES ({placeholders})', rows)
+    finally:
+        cursor.close()
+
+def refresh_mirror(conn, version: int, tables: Optional[List[str]] = None):
+    # Rebuilds the mirror file for data version `version`. Only `tables` are
+    # copied from MySQL, the rest come from the previous mirror when it was
+    # built for the version right before this one; an older mirror may have
+    # missed UPDATE scripts, so then everything is copied from MySQL.
+    if duckdb is None:
+        return
+    start_ts = time.time()
+    all_tables = mirrored_tables(conn)
+    tmp_path = f"{MIRROR_PATH}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    target = duckdb.connect(tmp_path)
+    try:
+        previous: Set[str] = set()
+        attached = tables is not None and os.path.exists(MIRROR_PATH)
+        if attached:
+            target.execute(f"ATTACH '{MIRROR_PATH}' AS previous (READ_ONLY)")
+            previous = {row[0] for row in target.execute(
+                "SELECT table_name FROM information_schema.tables WHERE table_catalog = 'previous'"
+            ).fetchall()}
+            state = target.execute(f"SELECT data_version FROM previous.{STATE_TABLE}").fetchone() \
+                if STATE_TABLE in previous else None
+            if not state or not carries_forward(state[0], version):
+                previous = set()
+
+        for table_name in all_tables:
+            if tables is not None and table_name not in tables and table_name in previous:
+                target.execute(f'CREATE TABLE "{table_name}" AS SELECT * FROM previous."{table_name}"')
+            else:
+                _copy_table(conn, target, table_name)
+        if attached:
+            target.execute("DETACH previous")
+
+        target.execute(f"CREATE TABLE {STATE_TABLE} (data_version BIGINT, refreshed_at BIGINT, tables VARCHAR)")
+        target.execute(f"INSERT INTO {STATE_TABLE} VALUES (?, ?, ?)", (version, int(time.time()), json.dumps(all_tables)))
+        target.execute("CHECKPOINT")
+    finally:
+        target.close()
+
+    # Readers keep the old file open until they notice the new one
+    os.replace(tmp_path, MIRROR_PATH)
+    print(f"Columnar mirror rebuilt for data version {version} ({len(all_tables)} tables) in {time.time() - start_ts:.2f}s")
+
+def translate_sql(sql: str, tables: Set[str]) -> Optional[str]:
+    # MySQL report SQL -> DuckDB, or None if it uses anything we can't map 1:1
+    unquoted = re.sub(r"'(?:[^'\\]|\\.)*'", "''", sql)
+    for name in re.findall(r"\b([A-Za-z_]\w*)\s*\(", unquoted):
+        if name.upper() not in ALLOWED_CALLS:
+            return None
+    for name in re.findall(r"\b(?:FROM|JOIN)\s+`?(\w+)`?", unquoted, flags=re.IGNORECASE):
+        if name not in tables:
+            return None
+
+    out, i = [], 0
+    for literal in re.finditer(r"'(?:[^'\\]|\\.)*'", sql):
+        out.append(_translate_code(sql[i:literal.start()]))
+        out.append(literal.group(0))
+        i = literal.end()
+    out.append(_translate_code(sql[i:]))
+    return "".join(out)
+
+def _translate_code(code: str) -> str:
+    code = code.replace("`", '"')
+    code = re.sub(r"\bDATE_FORMAT\s*\(", "strftime(", code, flags=re.IGNORECASE)
+    return code.replace("%s", "?")
+
+class MirrorReader:
+    # Read-only handle on the mirror file, reopened when ETL replaces it
+    def __init__(self, path: str = MIRROR_PATH):
+        self.path = path
+        self.version: Optional[int] = None
+        self.tables: Set[str] = set()
+        self._conn = None
+        self._file_id = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        file_id = (st.st_ino, st.st_mtime_ns)
+        if file_id == self._file_id:
+            return
+        with self._lock:
+            if file_id == self._file_id:
+                return
+            conn = duckdb.connect(self.path, read_only=True)
+            version, tables = conn.execute(f"SELECT data_version, tables FROM {STATE_TABLE}").fetchone()
+            old, self._conn = self._conn, conn
+            self.version, self.tables, self._file_id = int(version), set(json.loads(tables)), file_id
+            if old is not None:
+                old.close()
+
+    def ready_for(self, data_version: int) -> bool:
+        if duckdb is None:
+            return False
+        self.refresh()
+        return self._conn is not None and self.version == data_version
+
+    def execute(self, sql: str, params: List) -> Tuple[List[str], List[tuple]]:
+        cursor = self._conn.cursor()
+        try:
+            cursor.execute(sql, params)
+            columns = [col[0] for col in cursor.description]
+            return columns, cursor.fetchall()
+        finally:
+            cursor.close()
@@ -0,0 +1,118 @@
+import json
+from typing import Dict, Optional, Tuple
+
+# system_metadata keys holding monotonically increasing version counters.
+# Every ETL run (scripts and /api/etl/execute) bumps the data version, and the
+# API uses it to invalidate cached report results. The reports version is
+# bumped whenever bi_reports changes so every worker reloads its registry.
+DATA_VERSION_KEY = "data_version"
+REPORTS_VERSION_KEY = "reports_version"
+# Recent data versions with the low-watermark of what changed in each, so the
+# API can refresh cached time series from that point on instead of from scratch
+DATA_DELTAS_KEY = "data_deltas"
+MAX_DATA_DELTAS = 50
+
+def ensure_metadata_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS system_metadata (
+            `key` VARCHAR(255) PRIMARY KEY,
+            value LONGTEXT
+        );
+    """)
+
+def read_version(conn, key: str) -> int:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s", (key,))
+        row = cursor.fetchone()
+        if not row or row[0] is None:
+            return 0
+        return int(json.loads(row[0]))
+    finally:
+        cursor.close()
+
+def _increment(cursor, key: str) -> int:
+    # Atomic increment, safe when several ETL jobs finish at the same time.
+    # LAST_INSERT_ID(expr) hands back this connection's own new value, which
+    # re-reading the row wouldn't if another job bumped it in between.
+    cursor.execute("""
+        INSERT INTO system_metadata (`key`, value) VALUES (%s, LAST_INSERT_ID(1))
+        ON DUPLICATE KEY UPDATE value = LAST_INSERT_ID(CAST(value AS UNSIGNED) + 1)
+    """, (key,))
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    return int(cursor.fetchone()[0])
+
+def bump_version(conn, key: str) -> int:
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        version = _increment(cursor, key)
+        conn.commit()
+    finally:
+        cursor.close()
+    return version
+
+def read_data_version(conn) -> int:
+    return read_version(conn, DATA_VERSION_KEY)
+
+def bump_data_version(conn, low_watermarks: Optional[Dict[str, Tuple[str, str]]] = None) -> int:
+    # low_watermarks: table -> (time column, earliest value touched), for loads
+    # that only appended or changed rows from that point on. Leave it out for
+    # anything else, which makes the API recompute everything.
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        # One transaction around the version and its delta: the row lock on
+        # the deltas list makes concurrent bumps append one after the other
+        # instead of overwriting each other's entry
+        cursor.execute("INSERT IGNORE INTO system_metadata (`key`, value) VALUES (%s, '[]')", (DATA_DELTAS_KEY,))
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s FOR UPDATE", (DATA_DELTAS_KEY,))
+        row = cursor.fetchone()
+        version = _increment(cursor, DATA_VERSION_KEY)
+        deltas = json.loads(row[0]) if row and row[0] else []
+        deltas.append({
+            "version": version,
+            "low_watermarks": {t: list(w) for t, w in low_watermarks.items()} if low_watermarks else None,
+        })
+        cursor.execute(
+            "REPLACE INTO system_metadata (`key`, value) VALUES (%s, %s)",
+            (DATA_DELTAS_KEY, json.dumps(deltas[-MAX_DATA_DELTAS:]))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+    return version
+
+def read_low_watermarks(conn, from_version: int, to_version: int) -> Optional[Dict[str, Tuple[str, str]]]:
+    # Combined low-watermarks of every version after from_version up to
+    # to_version, or None if any of them changed data without one
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s", (DATA_DELTAS_KEY,))
+        row = cursor.fetchone()
+    finally:
+        cursor.close()
+    deltas = {d["version"]: d["low_watermarks"] for d in (json.loads(row[0]) if row and row[0] else [])}
+
+    combined = {}
+    for version in range(from_version + 1, to_version + 1):
+        watermarks = deltas.get(version)
+        if not watermarks:
+            return None
+        for table, (column, since) in watermarks.items():
+            if table in combined:
+                if combined[table][0] != column:
+                    return None
+                since = min(since, combined[table][1])
+            combined[table] = (column, since)
+    return combined
+
+def carries_forward(built_version: Optional[int], version: int) -> bool:
+    # A derived copy (samples, sketches, mirror, snapshot) built at
+    # built_version can keep the tables a load at `version` didn't touch only
+    # if that load is the one change since. Anything older may have missed
+    # UPDATE / backfill scripts, so it has to be rebuilt from MySQL.
+    return built_version is not None and version - 1 <= int(built_version) <= version
@@ -0,0 +1,136 @@
+import re
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+# Integer YYYYMMDD date keys on the fact tables, matching Dim_Time.time_key.
+# The keys are STORED generated columns with their own index, so every insert
+# or update of the datetime keeps them in sync without the ETL writing them.
+# build_report_sql groups day/month/year buckets on the key (and Dim_Time's
+# year/month columns) instead of running DATE_FORMAT over every fact row.
+# Dim_Time must have a row for every key (see extend_dim_time), or month and
+# year buckets would come out NULL.
+# Run this file directly (or call ensure_date_keys) to add missing key columns.
+
+DATE_KEYS = {
+    'Fact_Order': {'column': 'pay_date_key', 'source': 'pay_time'},
+    'Fact_Subscription': {'column': 'start_date_key', 'source': 'first_start_time'},
+}
+
+DATE_DIMENSION = "Dim_Time"
+
+def existing_date_keys(conn) -> List[str]:
+    # Fact tables that already carry their date key column
+    cursor = conn.cursor()
+    try:
+        found = []
+        for table_name, spec in DATE_KEYS.items():
+            cursor.execute("""
+                SELECT 1 FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+            """, (table_name, spec['column']))
+            if cursor.fetchone():
+                found.append(table_name)
+        return found
+    finally:
+        cursor.close()
+
+def ensure_date_keys(conn, tables: Optional[List[str]] = None):
+    # Cheap when the fact table has just been truncated, a full table rebuild
+    # otherwise, so ETL runs only pass the table they reload
+    present = existing_date_keys(conn)
+    cursor = conn.cursor()
+    try:
+        for table_name, spec in DATE_KEYS.items():
+            if table_name in present or (tables is not None and table_name not in tables):
+                continue
+            source = spec['source']
+            cursor.execute(f"""
+                ALTER TABLE `{table_name}`
+                ADD COLUMN `{spec['column']}` INT
+                    GENERATED ALWAYS AS (YEAR(`{source}`) * 10000 + MONTH(`{source}`) * 100 + DAY(`{source}`)) STORED,
+                ADD KEY `idx_{spec['column']}` (`{spec['column']}`)
+            """)
+            print(f"Added {table_name}.{spec['column']}")
+    finally:
+        cursor.close()
+
+def extend_dim_time(conn, tables: Optional[List[str]] = None):
+    # Add the Dim_Time rows the date keys of `tables` (all when None) point
+    # at but populate_dim_time.py didn't cover
+    cursor = conn.cursor()
+    try:
+        bounds = []
+        for table_name in existing_date_keys(conn):
+            if tables is not None and table_name not in tables:
+                continue
+            column = DATE_KEYS[table_name]['column']
+            # Zero dates have key 0 and no calendar day
+            cursor.execute(f"SELECT MIN(`{column}`), MAX(`{column}`) FROM `{table_name}` WHERE `{column}` > 0")
+            low, high = cursor.fetchone()
+            if low is not None:
+                bounds.extend([int(low), int(high)])
+        if not bounds:
+            return
+        low, high = min(bounds), max(bounds)
+        cursor.execute(f"SELECT time_key FROM `{DATE_DIMENSION}` WHERE time_key BETWEEN %s AND %s", (low, high))
+        present = {int(row[0]) for row in cursor.fetchall()}
+
+        missing = []
+        day = date(low // 10000, low // 100 % 100, low % 100)
+        last = date(high // 10000, high // 100 % 100, high % 100)
+        while day <= last:
+            time_key = day.year * 10000 + day.month * 100 + day.day
+            if time_key not in present:
+                missing.append((str(time_key), day.strftime('%Y-%m-%d'), day.year, day.month, day.strftime('%A'), '0'))
+            day += timedelta(days=1)
+        if missing:
+            cursor.executemany(
+                f"INSERT INTO `{DATE_DIMENSION}` (time_key, date, year, month, day_of_week, is_holiday) VALUES (%s, %s, %s, %s, %s, %s)",
+                missing
+            )
+            print(f"Added {len(missing)} days to {DATE_DIMENSION}")
+        conn.commit()
+    finally:
+        cursor.close()
+
+def bucket_by_date_key(report, group_expression: str) -> Optional[Tuple[str, str, str]]:
+    # Returns (x_result expression, extra join, GROUP BY list) for a
+    # DATE_FORMAT bucket over the fact table's date column, or None
+    spec = DATE_KEYS.get(report.source_table)
+    # Joined reports may use unqualified columns that Dim_Time would make ambiguous
+    if not spec or report.joins:
+        return None
+
+    table = report.source_table
+    expr = re.sub(rf"`?{table}`?\.", "", group_expression.strip()).replace("`", "")
+    m = re.match(r"^DATE_FORMAT\(\s*(\w+)\s*,\s*'([^']+)'\s*\)$", expr, flags=re.IGNORECASE)
+    if not m or m.group(1) != spec['source']:
+        return None
+
+    key = f"`{table}`.`{spec['column']}`"
+    fmt = m.group(2)
+    if fmt == "%Y-%m-%d":
+        # Day buckets need no join, the key itself is the bucket
+        label = f"CONCAT({key} DIV 10000, '-', LPAD({key} DIV 100 % 100, 2, '0'), '-', LPAD({key} % 100, 2, '0'))"
+        return label, "", key
+
+    # LEFT JOIN so NULL datetimes stay in a NULL bucket, as with DATE_FORMAT;
+    # every non-NULL key has its Dim_Time row (extend_dim_time)
+    join = f" LEFT JOIN `{DATE_DIMENSION}` ON `{DATE_DIMENSION}`.`time_key` = {key}"
+    if fmt == "%Y-%m":
+        label = f"CONCAT(`{DATE_DIMENSION}`.`year`, '-', LPAD(`{DATE_DIMENSION}`.`month`, 2, '0'))"
+        return label, join, f"`{DATE_DIMENSION}`.`year`, `{DATE_DIMENSION}`.`month`"
+    if fmt == "%Y":
+        label = f"CAST(`{DATE_DIMENSION}`.`year` AS CHAR)"
+        return label, join, f"`{DATE_DIMENSION}`.`year`"
+    return None
+
+if __name__ == "__main__":
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        ensure_date_keys(conn)
+        extend_dim_time(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+import mysql.connector
+import metrics
+
+# Shared MySQL access for the API and all ETL scripts.
+# Connections come from named, bounded pools (one per database) instead of
+# a fresh TCP + auth handshake per request.
+
+# MySQL Configuration
+DB_CONFIG = {
+    'user': 'root',
+    'password': 'ne@202509',
+    'host': 'localhost',
+    'port': 3306,
+    'database': 'bi_data',
+    'auth_plugin': 'mysql_native_password' # Often needed for 8.0 compatibility
+}
+
+# Named pools: pool name -> (database, max connections)
+POOLS = {
+    'bi_data': ('bi_data', 16),
+    'osaio': ('osaio', 4),
+}
+
+# How long a caller waits for a free connection before giving up
+CHECKOUT_TIMEOUT_SECONDS = 30
+# Idle connections older than this are pinged before being handed out
+PING_AFTER_IDLE_SECONDS = 30
+
+class PoolExhaustedError(mysql.connector.errors.PoolError):
+    pass
+
+class PooledConnection:
+    # Thin proxy around a MySQL connection; close() returns it to its pool.
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise mysql.connector.errors.OperationalError("Connection already returned to pool")
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._release(conn)
+
+    def discard(self):
+        # Drop the underlying connection instead of reusing it, e.g. after
+        # abandoning an unbuffered result set mid-stream
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool._discard(conn)
+            self._pool._free_slot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        # Safety net for code paths that forget to close()
+        try:
+            self.close()
+        except Exception:
+            pass
+
+class ConnectionPool:
+    def __init__(self, name: str, database: str, size: int):
+        self.name = name
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue() # (conn, last_used)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _open(self):
+        config = dict(DB_CONFIG, database=self.database)
+        return mysql.connector.connect(**config)
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        if time.monotonic() - last_used < PING_AFTER_IDLE_SECONDS:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def get_connection(self) -> PooledConnection:
+        wait_start = time.perf_counter()
+        acquired = self._slots.acquire(timeout=CHECKOUT_TIMEOUT_SECONDS)
+        metrics.pool_wait_seconds.observe(self.name, value=time.perf_counter() - wait_start)
+        if not acquired:
+            raise PoolExhaustedError(f"No free connection in pool '{self.name}' after {CHECKOUT_TIMEOUT_SECONDS}s")
+        try:
+            while True:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                if self._is_healthy(conn, last_used):
+                    break
+                self._discard(conn)
+        except BaseException:
+            self._slots.release()
+            raise
+        metrics.pool_in_use.inc(self.name)
+        return PooledConnection(self, conn)
+
+    def _free_slot(self):
+        metrics.pool_in_use.dec(self.name)
+        self._slots.release()
+
+    def _release(self, conn):
+        try:
+            # Reset state left behind by the caller before reusing the connection
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put((conn, time.monotonic()))
+        except Exception:
+            self._discard(conn)
+        finally:
+            self._free_slot()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(name: str = 'bi_data') -> ConnectionPool:
+    pool = _pools.get(name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                database, size = POOLS[name]
+                pool = ConnectionPool(name, database, size)
+                _pools[name] = pool
+    return pool
+
+def get_db_connection(name: str = 'bi_data') -> PooledConnection:
+    return get_pool(name).get_connection()
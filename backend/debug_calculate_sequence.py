@@ -1,18 +1,5 @@
-import mysql.connector
 from datetime import datetime
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data', # Primary DB
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from db import get_db_connection
 
 def get_source_table(app, region):
     # Map app/region to source table name in 'osaio' database
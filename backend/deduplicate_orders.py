@@ -1,19 +1,7 @@
-import mysql.connector
 from datetime import timedelta
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from db import get_db_connection
 
 def deduplicate_orders_final():
     conn = get_db_connection()
@@ -110,6 +98,7 @@ def deduplicate_orders_final():
             print(f"  Marked {updated_count} rows...")
             
         end_ts = time.time()
+        bump_data_version(conn)
         print(f"Deduplication Complete. Updated {updated_count} rows to status=2.")
         print(f"Time taken: {end_ts - start_ts:.2f} seconds")
 
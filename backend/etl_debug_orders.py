@@ -1,22 +1,15 @@
-import mysql.connector
 import uuid
 from datetime import datetime, timezone
 from decimal import Decimal
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
-
-
+from data_version import bump_data_version
+from date_keys import ensure_date_keys, extend_dim_time
+from columnar_mirror import refresh_mirror
+from filter_catalog import refresh_filter_catalog
+from hll_sketches import refresh_sketches
+from parquet_snapshots import write_snapshot
+from rollups import refresh_rollups
+from sampling import refresh_samples
+from db import get_db_connection
 
 def run_debug_etl():
     # Use two connections: one for reading, one for writing to avoid cursor conflicts
@@ -31,6 +24,8 @@ def run_debug_etl():
         print("Truncating Fact_Order...")
         write_cursor.execute("TRUNCATE TABLE Fact_Order")
         write_conn.commit()
+        # Adding the generated date key is instant on the empty table
+        ensure_date_keys(write_conn, tables=["Fact_Order"])
 
         # Source Configuration
         tasks = [
@@ -133,6 +128,14 @@ def run_debug_etl():
             print(f"Finished {table_name}.")
 
         print("All Done.")
+        extend_dim_time(write_conn, tables=["Fact_Order"])
+        refresh_rollups(write_conn)
+        version = bump_data_version(write_conn)
+        refresh_filter_catalog(write_conn, version, tables=["Fact_Order"])
+        refresh_sketches(write_conn, version, tables=["Fact_Order"])
+        refresh_samples(write_conn, version, tables=["Fact_Order"])
+        refresh_mirror(write_conn, version, tables=["Fact_Order"])
+        write_snapshot(write_conn, version, tables=["Fact_Order"])
 
     except Exception as e:
         print(f"Error: {e}")
@@ -1,18 +1,11 @@
-import mysql.connector
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from columnar_mirror import refresh_mirror
+from filter_catalog import refresh_filter_catalog
+from hll_sketches import refresh_sketches
+from parquet_snapshots import write_snapshot
+from sampling import refresh_samples
+from db import get_db_connection
 
 def etl_dim_plan():
     conn = get_db_connection()
@@ -132,6 +125,12 @@ def etl_dim_plan():
             print(f"  Inserted/Updated {len(batch_data)} rows.")
 
         print(f"ETL Complete. Total {total_inserted} plans in Dim_Plan.")
+        version = bump_data_version(conn)
+        refresh_filter_catalog(conn, version, tables=["Dim_Plan"])
+        refresh_sketches(conn, version, tables=["Dim_Plan"])
+        refresh_samples(conn, version, tables=["Dim_Plan"])
+        refresh_mirror(conn, version, tables=["Dim_Plan"])
+        write_snapshot(conn, version, tables=["Dim_Plan"])
 
     except Exception as e:
         print(f"Error: {e}")
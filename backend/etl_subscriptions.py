@@ -1,19 +1,14 @@
-import mysql.connector
 from datetime import datetime, timezone
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from date_keys import ensure_date_keys, extend_dim_time
+from columnar_mirror import refresh_mirror
+from filter_catalog import refresh_filter_catalog
+from hll_sketches import refresh_sketches
+from parquet_snapshots import write_snapshot
+from rollups import refresh_rollups
+from sampling import refresh_samples
+from db import get_db_connection
 
 def format_timestamp(ts):
     if not ts:
@@ -39,6 +34,8 @@ def run_subscriptions_etl():
         print("Truncating Fact_Subscription...")
         write_cursor.execute("TRUNCATE TABLE Fact_Subscription")
         write_conn.commit()
+        # Adding the generated date key is instant on the empty table
+        ensure_date_keys(write_conn, tables=["Fact_Subscription"])
 
         # Source Configuration
         tasks = [
@@ -166,6 +163,14 @@ def run_subscriptions_etl():
                         print(f"  Inserted {len(batch_data)} rows. Total: {total_inserted}")
 
         print(f"\nETL Complete. Total rows inserted into Fact_Subscription: {total_inserted}")
+        extend_dim_time(write_conn, tables=["Fact_Subscription"])
+        refresh_rollups(write_conn)
+        version = bump_data_version(write_conn)
+        refresh_filter_catalog(write_conn, version, tables=["Fact_Subscription"])
+        refresh_sketches(write_conn, version, tables=["Fact_Subscription"])
+        refresh_samples(write_conn, version, tables=["Fact_Subscription"])
+        refresh_mirror(write_conn, version, tables=["Fact_Subscription"])
+        write_snapshot(write_conn, version, tables=["Fact_Subscription"])
         
         if duplicates_found:
             print(f"\nDuplicate Subscriptions Found: {len(duplicates_found)}")
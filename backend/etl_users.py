@@ -1,19 +1,12 @@
-import mysql.connector
 from datetime import datetime, timezone
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from columnar_mirror import refresh_mirror
+from filter_catalog import refresh_filter_catalog
+from hll_sketches import refresh_sketches
+from parquet_snapshots import write_snapshot
+from sampling import refresh_samples
+from db import get_db_connection
 
 def run_users_etl(target_table="Dim_User"):
     read_conn = get_db_connection()
@@ -131,6 +124,12 @@ def run_users_etl(target_table="Dim_User"):
                         print(f"  Inserted {len(batch_data)} rows. Total: {total_inserted}")
 
         print(f"\nETL Complete. Total rows inserted into {target_table}: {total_inserted}")
+        version = bump_data_version(write_conn)
+        refresh_filter_catalog(write_conn, version, tables=[target_table])
+        refresh_sketches(write_conn, version, tables=[target_table])
+        refresh_samples(write_conn, version, tables=[target_table])
+        refresh_mirror(write_conn, version, tables=[target_table])
+        write_snapshot(write_conn, version, tables=[target_table])
         
     except Exception as e:
         print(f"ETL Error: {e}")
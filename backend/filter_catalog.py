@@ -0,0 +1,190 @@
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from slow_query_log import record_if_slow
+
+# Precomputed distinct values (with row counts) for dashboard filter columns.
+# /api/filter-values reads from bi_filter_values instead of running
+# SELECT DISTINCT over the fact table on every dashboard open.
+# A column's entry is valid for the data version it was built at; ETL scripts
+# rebuild report slice columns right after bumping the version, anything else
+# is rebuilt lazily on first use.
+
+VALUES_TABLE = "bi_filter_values"
+STATE_TABLE = "bi_filter_catalog"
+
+# Values of a numeric column (paid_sequence, plan ids in VARCHAR columns, ...)
+# are listed in numeric order
+NUMERIC_VALUE = r"^-?[0-9]+([.][0-9]+)?$"
+
+_rebuild_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_rebuild_locks_guard = threading.Lock()
+
+def ensure_catalog_tables(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {VALUES_TABLE} (
+            table_name VARCHAR(64) NOT NULL,
+            column_name VARCHAR(64) NOT NULL,
+            value VARCHAR(255) NOT NULL,
+            row_count BIGINT NOT NULL,
+            PRIMARY KEY (table_name, column_name, value),
+            KEY idx_frequency (table_name, column_name, row_count)
+        )
+    """)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            table_name VARCHAR(64) NOT NULL,
+            column_name VARCHAR(64) NOT NULL,
+            data_version BIGINT NOT NULL,
+            distinct_count BIGINT NOT NULL,
+            numeric_values TINYINT NOT NULL DEFAULT 0,
+            refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (table_name, column_name)
+        )
+    """)
+    # Catalogs created before numeric ordering
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = 'numeric_values'
+    """, (STATE_TABLE,))
+    if cursor.fetchone() is None:
+        cursor.execute(f"ALTER TABLE {STATE_TABLE} ADD COLUMN numeric_values TINYINT NOT NULL DEFAULT 0 AFTER distinct_count")
+
+def column_exists(conn, table_name: str, column_name: str) -> bool:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT 1 FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+        """, (table_name, column_name))
+        return cursor.fetchone() is not None
+    finally:
+        cursor.close()
+
+def catalog_version(conn, table_name: str, column_name: str) -> Optional[int]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT data_version FROM {STATE_TABLE} WHERE table_name = %s AND column_name = %s",
+            (table_name, column_name)
+        )
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+    except Exception:
+        # Catalog tables not created yet
+        return None
+    finally:
+        cursor.close()
+
+def _rebuild_lock(table_name: str, column_name: str) -> threading.Lock:
+    with _rebuild_locks_guard:
+        return _rebuild_locks.setdefault((table_name, column_name), threading.Lock())
+
+def rebuild_column(conn, table_name: str, column_name: str, version: int):
+    with _rebuild_lock(table_name, column_name):
+        # Another request may have rebuilt it while we waited
+        if catalog_version(conn, table_name, column_name) == version:
+            return
+        cursor = conn.cursor()
+        try:
+            ensure_catalog_tables(cursor)
+            start_ts = time.time()
+            cursor.execute(
+                f"DELETE FROM {VALUES_TABLE} WHERE table_name = %s AND column_name = %s",
+                (table_name, column_name)
+            )
+            rebuild_sql = f"""
+                INSERT INTO {VALUES_TABLE} (table_name, column_name, value, row_count)
+                SELECT %s, %s, LEFT(CAST(`{column_name}` AS CHAR), 255), COUNT(*)
+                FROM `{table_name}`
+                WHERE `{column_name}` IS NOT NULL AND `{column_name}` != ''
+                GROUP BY `{column_name}`
+                ON DUPLICATE KEY UPDATE row_count = row_count + VALUES(row_count)
+            """
+            statement_ts = time.time()
+            cursor.execute(rebuild_sql, (table_name, column_name))
+            statement_duration = time.time() - statement_ts
+            cursor.execute(f"""
+                REPLACE INTO {STATE_TABLE} (table_name, column_name, data_version, distinct_count, numeric_values)
+                SELECT %s, %s, %s, COUNT(*), COALESCE(SUM(value NOT REGEXP %s), 0) = 0
+                FROM {VALUES_TABLE} WHERE table_name = %s AND column_name = %s
+            """, (table_name, column_name, version, NUMERIC_VALUE, table_name, column_name))
+            conn.commit()
+            print(f"Filter catalog {table_name}.{column_name} rebuilt in {time.time() - start_ts:.2f}s")
+            record_if_slow(conn, "filter_catalog_rebuild", rebuild_sql, [table_name, column_name], statement_duration)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+def numeric_values(conn, table_name: str, column_name: str) -> bool:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT numeric_values FROM {STATE_TABLE} WHERE table_name = %s AND column_name = %s",
+            (table_name, column_name)
+        )
+        row = cursor.fetchone()
+        return bool(row and row[0])
+    finally:
+        cursor.close()
+
+def lookup(conn, table_name: str, column_name: str, prefix: Optional[str], limit: int, order: str):
+    # Returns (values, counts, truncated)
+    sql = f"SELECT value, row_count FROM {VALUES_TABLE} WHERE table_name = %s AND column_name = %s"
+    params = [table_name, column_name]
+    if prefix:
+        # Prefix range on the primary key
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        sql += " AND value LIKE %s"
+        params.append(escaped + "%")
+    if order == "count":
+        sql += " ORDER BY row_count DESC, value"
+    elif numeric_values(conn, table_name, column_name):
+        # Ordered before the LIMIT, so a numeric column gets its smallest values
+        sql += " ORDER BY CAST(value AS DECIMAL(65, 10)), value"
+    else:
+        sql += " ORDER BY value"
+    # One extra row tells us whether the list was cut off
+    sql += f" LIMIT {int(limit) + 1}"
+
+    cursor = conn.cursor()
+    try:
+        start_ts = time.time()
+        cursor.execute(sql, tuple(params))
+        rows = cursor.fetchall()
+        duration = time.time() - start_ts
+    finally:
+        cursor.close()
+    record_if_slow(conn, "filter_values", sql, params, duration, len(rows))
+
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    return [r[0] for r in rows], [int(r[1]) for r in rows], truncated
+
+def report_slice_columns(conn, tables: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+    # (table, column) pairs used as dashboard filters by saved reports
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT config FROM bi_reports")
+        configs = [json.loads(row[0]) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+    pairs = []
+    for config in configs:
+        table_name = config.get("source_table")
+        if not table_name or (tables and table_name not in tables):
+            continue
+        for column_name in config.get("slices") or []:
+            pair = (table_name, column_name)
+            if pair not in pairs and column_exists(conn, table_name, column_name):
+                pairs.append(pair)
+    return pairs
+
+def refresh_filter_catalog(conn, version: int, tables: Optional[List[str]] = None):
+    for table_name, column_name in report_slice_columns(conn, tables):
+        rebuild_column(conn, table_name, column_name, version)
@@ -0,0 +1,308 @@
+import json
+import math
+import re
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from data_version import carries_forward, ensure_metadata_table
+from rollups import rewrite_group_expression, rewrite_time_range, split_alias, split_top_level
+
+# Daily HyperLogLog sketches for COUNT(DISTINCT ...) measures.
+# For every day, app_key / region_key, segment and sketched column the ETL
+# stores one row holding all 2^PRECISION registers as a zlib-compressed byte
+# array (one byte of rho per register), hashing with the first 64 bits of MD5.
+# That is O(days x dimension values) rows however many facts there are.
+# Merging sketches is an element-wise max of the registers, done here on the
+# fetched arrays, so any granularity and filter combination is one scan of
+# the matching rows. Error is about 1.04 / sqrt(2^PRECISION).
+# Sketches are stamped with the data version they were built at and only used
+# while it is current. Call refresh_sketches after bumping the data version.
+
+SKETCH_STATE_KEY = "sketch_state"
+# 2^14 registers: ~0.8% standard error
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+# rho never exceeds 64 - PRECISION + 1, so every register fits in 7 bits
+MAX_RHO = 64 - PRECISION + 1
+INSERT_BATCH_SIZE = 500
+
+SKETCHES = {
+    'Fact_Order': {
+        'table': 'Sketch_Order_Daily',
+        'date_column': 'pay_time',
+        'dimensions': ['app_key', 'region_key'],
+        'columns': ['user_uid', 'device_id'],
+        # Report base_where conditions that get their own sketches
+        'segments': {
+            'all': None,
+            'paying': 'cny_amount > 0',
+            'trial': 'amount = 0',
+        },
+    },
+    'Fact_Subscription': {
+        'table': 'Sketch_Subscription_Daily',
+        'date_column': 'first_start_time',
+        'dimensions': ['app_key', 'region_key'],
+        'columns': ['user_uid'],
+        'segments': {
+            'all': None,
+        },
+    },
+}
+
+def _create_sketch_table(cursor, spec: Dict):
+    dim_cols = ", ".join(f"`{d}` VARCHAR(255)" for d in spec['dimensions'])
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{spec['table']}` (
+            `day` DATE,
+            {dim_cols},
+            `segment` VARCHAR(32) NOT NULL,
+            `metric` VARCHAR(64) NOT NULL,
+            `registers` MEDIUMBLOB NOT NULL,
+            KEY idx_segment_metric_day (`segment`, `metric`, `day`)
+        )
+    """)
+
+def _build_registers(conn, spec: Dict, fact_table: str, column: str, condition: Optional[str]) -> List[tuple]:
+    # (day, *dims, packed registers) for every day / dimension combination,
+    # streamed in key order so only one register array is open at a time
+    dims = ", ".join(f"`{d}`" for d in spec['dimensions'])
+    where = f"`{column}` IS NOT NULL AND `{spec['date_column']}` IS NOT NULL"
+    if condition:
+        where += f" AND ({condition})"
+    # reg: low PRECISION bits; rho: position of the first 1 bit in the rest
+    sql = f"""
+        SELECT `day`, {dims}, h & {REGISTERS - 1} AS reg,
+               MAX(IF(h >> {PRECISION} = 0, {MAX_RHO}, {MAX_RHO} - LENGTH(BIN(h >> {PRECISION})))) AS rho
+        FROM (
+            SELECT DATE(`{spec['date_column']}`) AS `day`, {dims},
+                   CAST(CONV(SUBSTRING(MD5(`{column}`), 1, 16), 16, 10) AS UNSIGNED) AS h
+            FROM `{fact_table}`
+            WHERE {where}
+        ) hashed
+        GROUP BY `day`, {dims}, reg
+        ORDER BY `day`, {dims}
+    """
+    packed = []
+    current, registers = None, None
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(sql)
+        for row in cursor:
+            key = row[:-2]
+            if key != current:
+                if registers is not None:
+                    packed.append((*current, zlib.compress(bytes(registers))))
+                current, registers = key, bytearray(REGISTERS)
+            registers[row[-2]] = row[-1]
+    finally:
+        cursor.close()
+    if registers is not None:
+        packed.append((*current, zlib.compress(bytes(registers))))
+    return packed
+
+def read_sketch_state(conn) -> Dict:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s", (SKETCH_STATE_KEY,))
+        row = cursor.fetchone()
+        return json.loads(row[0]) if row else {}
+    finally:
+        cursor.close()
+
+def refresh_sketches(conn, version: int, tables: Optional[List[str]] = None):
+    # Rebuilds the sketches of `tables` (all when None) for data version
+    # `version`; the others are kept only if they were current right before this load
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        state = read_sketch_state(conn)
+        built = set()
+        if tables is not None and state.get("precision") == PRECISION and carries_forward(state.get("version"), version):
+            built = set(state.get("tables", []))
+        else:
+            tables = None
+        for fact_table, spec in SKETCHES.items():
+            if tables is not None and fact_table not in tables:
+                continue
+            start_ts = time.time()
+            _create_sketch_table(cursor, spec)
+            dims = ", ".join(f"`{d}`" for d in spec['dimensions'])
+            placeholders = ", ".join(["%s"] * (len(spec['dimensions']) + 4))
+
+            # Rebuild inside one transaction so readers never see half the sketches
+            cursor.execute(f"DELETE FROM `{spec['table']}`")
+            rows = 0
+            for segment, condition in spec['segments'].items():
+                for column in spec['columns']:
+                    packed = _build_registers(conn, spec, fact_table, column, condition)
+                    for i in range(0, len(packed), INSERT_BATCH_SIZE):
+                        cursor.executemany(
+                            f"INSERT INTO `{spec['table']}` (`day`, {dims}, `segment`, `metric`, `registers`) "
+                            f"VALUES ({placeholders})",
+                            [(*key, segment, column, registers) for *key, registers in packed[i:i + INSERT_BATCH_SIZE]]
+                        )
+                    rows += len(packed)
+            built.add(fact_table)
+            print(f"Sketches {spec['table']} rebuilt: {rows} rows in {time.time() - start_ts:.2f}s")
+
+        cursor.execute(
+            "REPLACE INTO system_metadata (`key`, value) VALUES (%s, %s)",
+            (SKETCH_STATE_KEY, json.dumps({
+                "version": version, "tables": sorted(built), "precision": PRECISION, "refreshed_at": int(time.time())
+            }))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def sketch_tables(conn, version: int) -> List[str]:
+    # Fact tables with sketches built for data version `version` at the current PRECISION
+    state = read_sketch_state(conn)
+    if state.get("precision") != PRECISION or state.get("version") != version:
+        return []
+    return state.get("tables", [])
+
+def _normalize(expr: str, table: str) -> str:
+    expr = re.sub(rf"`?{table}`?\.", "", expr).replace("`", "")
+    return re.sub(r"\s+", " ", expr).strip().lower()
+
+def _distinct_column(expr: str, table: str) -> Optional[str]:
+    # COUNT(DISTINCT col), COUNT(DISTINCT(col)) or count (distinct (col))
+    m = re.match(r"^COUNT\s*\(\s*DISTINCT\s*\(?\s*`?(?:\w+`?\.`?)?(\w+)`?\s*\)?\s*\)$", expr.strip(), flags=re.IGNORECASE)
+    if not m:
+        return None
+    prefix = re.match(r"^COUNT\s*\(\s*DISTINCT\s*\(?\s*`?(\w+)`?\.", expr.strip(), flags=re.IGNORECASE)
+    if prefix and prefix.group(1) != table:
+        return None
+    return m.group(1)
+
+def _segment(spec: Dict, base_where: Optional[str], table: str) -> Optional[str]:
+    target = _normalize(base_where, table) if base_where else None
+    for segment, condition in spec['segments'].items():
+        if (condition and _normalize(condition, table)) == target:
+            return segment
+    return None
+
+def build_sketch_sql(report, group_expression: str, filters: Dict,
+                     time_range: Optional[tuple] = None) -> Optional[Tuple[str, List, List[Tuple[str, str]]]]:
+    # (sql, params, [(series name, metric)]) fetching the register arrays to
+    # merge per bucket, or None if the report can't be answered from the sketches
+    spec = SKETCHES.get(report.source_table)
+    if not spec or report.joins:
+        return None
+    segment = _segment(spec, report.base_where, report.source_table)
+    if segment is None:
+        return None
+
+    measures = []
+    for term in split_top_level(report.measure_formula or ""):
+        expr, alias = split_alias(term)
+        column = _distinct_column(expr, report.source_table)
+        if column not in spec['columns']:
+            return None
+        measures.append((alias if alias is not None else expr, column))
+    if not measures:
+        return None
+
+    group_sql = rewrite_group_expression(group_expression, report.source_table, spec)
+    if not group_sql:
+        return None
+
+    metrics = sorted({metric for _, metric in measures})
+    params = [segment, *metrics]
+    where_clauses = [
+        "`segment` = %s",
+        f"`metric` IN ({', '.join(['%s'] * len(metrics))})",
+    ]
+    for col, val in filters.items():
+        if not val:
+            continue
+        if col not in spec['dimensions']:
+            return None
+        if isinstance(val, list):
+            placeholders = ', '.join(['%s'] * len(val))
+            where_clauses.append(f"`{col}` IN ({placeholders})")
+            params.extend(val)
+        else:
+            where_clauses.append(f"`{col}` = %s")
+            params.append(val)
+
+    time_clauses = rewrite_time_range(time_range, report.source_table, spec)
+    if time_clauses is None:
+        return None
+    where_clauses.extend(time_clauses[0])
+    params.extend(time_clauses[1])
+
+    sql = f"""
+        SELECT {group_sql} AS x_result, `metric`, `registers`
+        FROM `{spec['table']}`
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY x_result
+    """
+    return sql, params, measures
+
+# Each register is one byte below 0x80, so a whole array can be handled as one
+# big integer and merged lane by lane: setting the high bit of every lane in a
+# before subtracting b leaves it set exactly where a >= b, and no lane borrows
+# from its neighbour.
+_HIGH_BITS = int.from_bytes(b"\x80" * REGISTERS, "big")
+_LANES = int.from_bytes(b"\xff" * REGISTERS, "big")
+
+def merge_registers(a: int, b: int) -> int:
+    keep_a = (((a | _HIGH_BITS) - b) & _HIGH_BITS) >> 7
+    keep_a *= 0xFF
+    return (a & keep_a) | (b & (_LANES ^ keep_a))
+
+def estimate(nonzero: float, harmonic: float) -> float:
+    # Standard HLL estimate with linear counting for small cardinalities;
+    # registers that never got a value contribute 2^0 each
+    m = REGISTERS
+    zeros = m - nonzero
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / (harmonic + zeros)
+    if raw <= 2.5 * m and zeros > 0:
+        return m * math.log(m / zeros)
+    return raw
+
+def estimate_registers(merged: int) -> float:
+    registers = merged.to_bytes(REGISTERS, "big")
+    nonzero = REGISTERS - registers.count(0)
+    harmonic = sum(registers.count(rho) * 2.0 ** -rho for rho in range(1, MAX_RHO + 1))
+    return estimate(nonzero, harmonic)
+
+def merge_sketch_rows(rows: List[tuple], measures: List[Tuple[str, str]]) -> Dict:
+    # Rows of (x_result, metric, registers) in x_result order -> one estimate
+    # per bucket and measure
+    x_axis = []
+    merged = {}
+    for x_value, metric, packed in rows:
+        if not x_axis or x_axis[-1] != x_value:
+            x_axis.append(x_value)
+        registers = int.from_bytes(zlib.decompress(packed), "big")
+        key = (x_value, metric)
+        merged[key] = merge_registers(merged[key], registers) if key in merged else registers
+    return {
+        "x_axis": x_axis,
+        "series": [
+            {
+                "name": name,
+                "data": [round(estimate_registers(merged[(x, metric)])) if (x, metric) in merged else 0 for x in x_axis],
+            } for name, metric in measures
+        ],
+        "approximate": True,
+    }
+
+if __name__ == "__main__":
+    from data_version import read_data_version
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        refresh_sketches(conn, read_data_version(conn))
+    finally:
+        conn.close()
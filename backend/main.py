@@ -1,14 +1,58 @@
+import asyncio
+import hashlib
 import json
 import os
+import random
+import re
+import threading
+import time
 import mysql.connector
+from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from data_version import read_data_version, bump_data_version, read_low_watermarks
+from db import DB_CONFIG, get_db_connection
+from query_cache import ResultCache, make_cache_key, normalize_filters
+from report_registry import ReportRegistry
+from rollups import build_rollup_sql, mark_rollups_stale, refresh_rollups, rollups_ready, split_alias, split_top_level, ROLLUPS
+from date_keys import DATE_KEYS, bucket_by_date_key, existing_date_keys, extend_dim_time
+from columnar_mirror import MirrorReader, mirror_available, refresh_mirror, translate_sql
+from period_compare import BUCKET_STARTS, COMPARE_LABELS, align_compare, merge_period_results, plan_periods
+from parquet_snapshots import (execute_snapshot_query, load_manifest, snapshot_sql, snapshot_versions,
+                               snapshots_queryable, write_snapshot)
+import filter_catalog
+import metrics
+from cache_warmup import CacheWarmer, QueryUsage, WARMUP_TOP_QUERIES_PER_REPORT, WARMUP_TTL_SECONDS
+import hll_sketches
+import query_guard
+import sampling
+import slow_query_log
+from response_encoding import (ARROW_MEDIA_TYPE, FastJSONResponse, arrow_available, encode_arrow, encode_json, etag_matches,
+                               make_etag, not_modified, numeric_column, wants_arrow)
+import table_browser
+from query_runner import QUERY_EXECUTOR, QueryHandle, acquire_shared_handle, endpoint_semaphores, kill_query, release_shared_handle, run_cancellable
 
 app = FastAPI()
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start_ts = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route template (/api/data/{table_name}), not the raw path, to keep label cardinality bounded
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        metrics.http_request_seconds.observe(request.method, endpoint, str(status), value=time.perf_counter() - start_ts)
+
 # Allow CORS for Frontend
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +60,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Not CORS-safelisted: the frontend needs it for If-None-Match revalidation
+    expose_headers=["ETag"],
 )
 
 # Resolve absolute path to avoid CWD issues
@@ -26,16 +72,6 @@ REPORTS_FILE = os.path.join(BASE_DIR, "bi_reports.json")
 print(f"Backend initialized. Schema file: {SCHEMA_FILE}")
 print(f"Reports file: {REPORTS_FILE}")
 
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data', # Will ensure this exists
-    'auth_plugin': 'mysql_native_password' # Often needed for 8.0 compatibility
-}
-
 # Ensure Database Exists
 def init_mysql_db():
     # Connect to MySQL server to create DB if needed
@@ -58,8 +94,90 @@ try:
 except:
     pass # Will fail later if critical
 
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+# Report result cache (see query_cache.py)
+RESULT_CACHE_MAX_ENTRIES = 512
+RESULT_CACHE_TTL_SECONDS = 600
+# How often we re-read the data version written by external ETL scripts
+DATA_VERSION_POLL_SECONDS = 2.0
+
+# Answer compatible reports from the Agg_* daily rollups (see rollups.py)
+ROLLUPS_ENABLED = True
+# Merge batch reports that scan the same rows into one SELECT
+SHARED_SCAN_ENABLED = True
+_rollup_state = {"version": None, "ready": False}
+# Bucket time reports on the integer date keys (see date_keys.py)
+DATE_KEYS_ENABLED = True
+_date_key_state = {"version": None, "tables": []}
+
+result_cache = ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES, ttl_seconds=RESULT_CACHE_TTL_SECONDS)
+
+# Filter dropdown values (see filter_catalog.py)
+FILTER_VALUES_DEFAULT_LIMIT = 1000
+FILTER_VALUES_MAX_LIMIT = 10000
+filter_value_cache = ResultCache(max_entries=256, ttl_seconds=RESULT_CACHE_TTL_SECONDS)
+
+def collect_cache_metrics():
+    metrics.observe_cache("result", result_cache)
+    metrics.observe_cache("filter_values", filter_value_cache)
+    metrics.observe_cache("query_plan", query_guard.plan_cache)
+
+metrics.add_collector(collect_cache_metrics)
+_data_version_state = {"value": 0, "checked_at": 0.0}
+# Request threads and ETL calls can notice a new version at the same time;
+# only one of them may stash the previous version's results
+_data_version_lock = threading.Lock()
+
+# Keep cached time series across ETL runs that report a low-watermark and only
+# recompute the buckets from it on (see bump_data_version in data_version.py)
+INCREMENTAL_REFRESH_ENABLED = True
+# Results cached under the previous data version, waiting to be topped up
+_incremental_state = {"version": None, "low_watermarks": None, "bases": {}}
+
+def _set_data_version(version: int, conn=None):
+    with _data_version_lock:
+        previous = _data_version_state["value"]
+        if version > previous:
+            stash_incremental_bases(conn, previous, version)
+            # Entries keyed on an older version can never be hit again
+            result_cache.clear()
+            filter_value_cache.clear()
+            _data_version_state["value"] = version
+        _data_version_state["checked_at"] = time.monotonic()
+
+def base_cache_key(cache_key: tuple) -> tuple:
+    # Cache key without its data version
+    return cache_key[:4] + cache_key[5:]
+
+def stash_incremental_bases(conn, previous: int, version: int):
+    low_watermarks = None
+    if INCREMENTAL_REFRESH_ENABLED and conn is not None and previous:
+        try:
+            low_watermarks = read_low_watermarks(conn, previous, version)
+        except Exception as e:
+            print(f"Warning: Failed to read data deltas: {e}")
+    bases = {}
+    if low_watermarks:
+        bases = {base_cache_key(k): v for k, v in result_cache.items() if k[4] == previous}
+    _incremental_state.update(version=version, low_watermarks=low_watermarks, bases=bases)
+
+def get_data_version() -> int:
+    if time.monotonic() - _data_version_state["checked_at"] < DATA_VERSION_POLL_SECONDS:
+        return _data_version_state["value"]
+    conn = get_db_connection()
+    try:
+        _set_data_version(read_data_version(conn), conn)
+    except Exception as e:
+        print(f"Warning: Failed to read data version: {e}")
+    finally:
+        conn.close()
+    return _data_version_state["value"]
+
+def mark_data_changed(low_watermarks: Optional[Dict[str, tuple]] = None):
+    conn = get_db_connection()
+    try:
+        _set_data_version(bump_data_version(conn, low_watermarks), conn)
+    finally:
+        conn.close()
 
 class Column(BaseModel):
     name: str
@@ -98,6 +216,10 @@ class ReportConfig(BaseModel):
     slices: List[str] = [] 
     image: Optional[str] = None
     base_where: Optional[str] = None
+    time_column: Optional[str] = None # Raw time column for start/end; inferred from group_by if empty
+    default_window_days: Optional[int] = None # Window applied when a query has no start/end (None = all history)
+
+report_registry = ReportRegistry(get_db_connection, lambda raw: ReportConfig(**raw))
 
 class ReportsPayload(BaseModel):
     reports: List[ReportConfig]
@@ -116,13 +238,7 @@ class EtlRequest(BaseModel):
 def get_osaio_tables():
     # Connect to osaio DB
     try:
-        conn = mysql.connector.connect(
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database='osaio'  # Explicitly connect to osaio
-        )
+        conn = get_db_connection('osaio')
         cursor = conn.cursor()
         cursor.execute("SHOW TABLES")
         tables = [row[0] for row in cursor.fetchall()]
@@ -139,13 +255,7 @@ def get_osaio_columns(table_name: str):
          raise HTTPException(status_code=400, detail="Invalid table name")
          
     try:
-        conn = mysql.connector.connect(
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database='osaio'
-        )
+        conn = get_db_connection('osaio')
         cursor = conn.cursor()
         cursor.execute(f"DESCRIBE `{table_name}`")
         columns = [row[0] for row in cursor.fetchall()]
@@ -154,6 +264,14 @@ def get_osaio_columns(table_name: str):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch columns: {str(e)}")
 
+def primary_key_columns(cursor, table_name: str) -> List[str]:
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.KEY_COLUMN_USAGE
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+        ORDER BY ORDINAL_POSITION
+    """, (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
 @app.post("/api/etl/execute")
 def execute_etl(request: EtlRequest):
     conn = get_db_connection() # Connects to bi_data
@@ -168,25 +286,91 @@ def execute_etl(request: EtlRequest):
         # INSERT INTO bi_data.Target (c1, c2) SELECT expr1, expr2 FROM osaio.Source
         
         target_cols = [f"`{m.target_column}`" for m in request.mappings]
-        source_exprs = [m.source_expression for m in request.mappings] # expressions are raw SQL
-        
+        # expressions are raw SQL, named after their target column
+        batch_sql = ", ".join(f"{m.source_expression} AS `{m.target_column}`" for m in request.mappings)
+        new_rows = f"FROM (SELECT {batch_sql} FROM osaio.`{request.source_table}`) AS batch"
+        if not request.truncate_target:
+            # Appending: source rows whose primary key is already loaded are
+            # skipped (they used to fail the whole load with a duplicate key)
+            key_columns = primary_key_columns(cursor, request.target_table)
+            if key_columns and all(f"`{c}`" in target_cols for c in key_columns):
+                match = " AND ".join(f"t.`{c}` = batch.`{c}`" for c in key_columns)
+                new_rows += f" WHERE NOT EXISTS (SELECT 1 FROM `{request.target_table}` t WHERE {match})"
+
         sql = f"""
             INSERT INTO `{request.target_table}` ({', '.join(target_cols)})
-            SELECT {', '.join(source_exprs)}
-            FROM osaio.`{request.source_table}`
+            SELECT {', '.join(f'batch.{c}' for c in target_cols)}
+            {new_rows}
         """
         
+        low_watermarks = None
+        spec = ROLLUPS.get(request.target_table)
+        if spec and not request.truncate_target and f"`{spec['date_column']}`" in target_cols:
+            # Cached series only need the buckets from the earliest row this run inserts on
+            cursor.execute(f"SELECT MIN(batch.`{spec['date_column']}`) {new_rows}")
+            since = cursor.fetchone()[0]
+            if since is not None:
+                low_watermarks = {request.target_table: (spec['date_column'], str(since))}
+
         print(f"Executing ETL: {sql}")
-        cursor.execute(sql)
+        with slow_query_log.timed_statement(conn, "etl_execute", sql):
+            cursor.execute(sql)
         conn.commit()
-        return {"status": "success", "message": f"Data imported from {request.source_table} to {request.target_table}"}
-        
     except Exception as e:
         conn.rollback()
+        conn.close()
         print(f"ETL Error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
+
+    # The rows are committed from here on: a failed refresh must not report
+    # the load as failed, or a retry would load them twice
+    try:
+        refresh_errors = refresh_after_load(conn, request.target_table, low_watermarks)
     finally:
         conn.close()
+    response = {"status": "success", "message": f"Data imported from {request.source_table} to {request.target_table}"}
+    if refresh_errors:
+        response["refresh_errors"] = refresh_errors
+    return response
+
+# Attempts per derived structure after an ETL load before giving up on it
+ETL_REFRESH_ATTEMPTS = 2
+
+def refresh_after_load(conn, table_name: str, low_watermarks: Optional[Dict[str, tuple]]) -> List[str]:
+    # Rebuild what depends on table_name after a committed load. Each step is
+    # retried and then logged on its own; readers fall back to the base tables
+    # for anything left stale (rollups are marked so, the rest no longer
+    # matches the data version).
+    steps = []
+    if table_name in DATE_KEYS:
+        steps.append(("date dimension", lambda: extend_dim_time(conn, tables=[table_name])))
+    if table_name in ROLLUPS:
+        steps.append(("rollups", lambda: refresh_rollups(conn)))
+    steps.append(("data version", lambda: mark_data_changed(low_watermarks)))
+    steps.append(("sketches", lambda: hll_sketches.refresh_sketches(conn, get_data_version(), tables=[table_name])))
+    steps.append(("samples", lambda: sampling.refresh_samples(conn, get_data_version(), tables=[table_name])))
+    # Same order as the ETL scripts
+    steps.append(("filter catalog",
+                  lambda: filter_catalog.refresh_filter_catalog(conn, get_data_version(), tables=[table_name])))
+    steps.append(("mirror", lambda: refresh_mirror(conn, get_data_version(), tables=[table_name])))
+    steps.append(("snapshot", lambda: write_snapshot(conn, get_data_version(), tables=[table_name])))
+
+    errors = []
+    for name, step in steps:
+        for attempt in range(1, ETL_REFRESH_ATTEMPTS + 1):
+            try:
+                step()
+                break
+            except Exception as e:
+                print(f"ETL refresh of {name} for {table_name} failed (attempt {attempt}): {e}")
+                if attempt == ETL_REFRESH_ATTEMPTS:
+                    errors.append(f"{name}: {e}")
+                    if name == "rollups":
+                        try:
+                            mark_rollups_stale(conn)
+                        except Exception as e2:
+                            print(f"Failed to mark rollups stale: {e2}")
+    return errors
 
 @app.post("/api/etl/preview")
 def preview_etl(request: EtlRequest):
@@ -212,8 +396,9 @@ def preview_etl(request: EtlRequest):
             sql = f"SELECT {', '.join(select_exprs)} FROM osaio.`{request.source_table}` LIMIT 1"
             
             try:
-                cursor.execute(sql)
-                transformed_row = cursor.fetchone()
+                with slow_query_log.timed_statement(conn, "etl_preview", sql):
+                    cursor.execute(sql)
+                    transformed_row = cursor.fetchone()
                 # Handle non-serializable types (like datetime)
                 for k, v in transformed_row.items():
                     if hasattr(v, 'isoformat'):
@@ -242,6 +427,29 @@ class QueryRequest(BaseModel):
     report_id: str
     filters: Dict[str, Any] = {}
     granularity: str = "day"
+    start: Optional[str] = None # Inclusive, e.g. "2025-01-01"
+    end: Optional[str] = None # Exclusive
+    snapshot_version: Optional[int] = None # Answer from that Parquet snapshot (see /api/snapshots)
+    sample: bool = False # Approximate answer from the 1% sample tables, with error bars
+    exact: bool = False # Count distinct values on the fact table instead of merging HLL sketches
+    split_by: Optional[str] = None # One of the report's slices: one series per value of it
+    split_limit: int = 10 # Values kept by total; the rest are summed into "Other"
+    compare: Optional[str] = None # "previous" (period before start..end) or "year" (same period a year earlier)
+
+class DryRunRequest(BaseModel):
+    report: ReportConfig
+    filters: Dict[str, Any] = {}
+    granularity: str = "day"
+    start: Optional[str] = None
+    end: Optional[str] = None
+    sample: bool = False # Also run the report on the sample tables and return it as "preview"
+
+class BatchQueryItem(QueryRequest):
+    key: Optional[str] = None # Defaults to report_id; set it when one report appears twice
+
+class BatchQueryRequest(BaseModel):
+    queries: List[BatchQueryItem]
+    stream: bool = True
 
 
 def init_meta_db():
@@ -285,6 +493,15 @@ def set_metadata(key: str, data: Any):
 def read_root():
     return {"message": "Smart Home BI Backend API (MySQL)"}
 
+def map_column_type(c_type_raw: str) -> str:
+    # Simplified Mapping
+    c_type = "TEXT"
+    if "int" in c_type_raw: c_type = "INTEGER"
+    elif "decimal" in c_type_raw: c_type = "DECIMAL"
+    elif "datetime" in c_type_raw: c_type = "DATETIME"
+    elif "char" in c_type_raw: c_type = "TEXT"
+    return c_type
+
 def inspect_db_schema() -> Dict:
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -292,10 +509,36 @@ def inspect_db_schema() -> Dict:
     schema_data = {"dimensions": [], "facts": []}
     
     try:
-        cursor.execute("SHOW TABLES")
-        tables = [row[0] for row in cursor.fetchall()]
+        # Whole schema in three round trips instead of SHOW TABLES + one DESCRIBE per table
+        cursor.execute("""
+            SELECT TABLE_NAME, TABLE_ROWS FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_TYPE = 'BASE TABLE'
+        """)
+        row_estimates = {row[0]: row[1] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT TABLE_NAME, INDEX_NAME, NON_UNIQUE, COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+        """)
+        indexes = {} # table -> {index name -> {"name", "unique", "columns"}}
+        for t_name, i_name, non_unique, c_name in cursor.fetchall():
+            table_indexes = indexes.setdefault(t_name, {})
+            index = table_indexes.setdefault(i_name, {"name": i_name, "unique": not non_unique, "columns": []})
+            index["columns"].append(c_name)
+
+        cursor.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, COLUMN_KEY FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """)
+        tables = {}
+        for table_name, c_name, c_type_raw, c_key in cursor.fetchall():
+            if table_name not in row_estimates:
+                continue # Views
+            tables.setdefault(table_name, []).append((c_name, c_type_raw, c_key))
         
-        for table_name in tables:
+        for table_name, raw_columns in tables.items():
             if table_name == "system_metadata":
                 continue
                 
@@ -308,33 +551,27 @@ def inspect_db_schema() -> Dict:
             else:
                 continue # Ignore non-conforming tables for now
             
-            # Describe
-            cursor.execute(f"DESCRIBE {table_name}")
+            table_indexes = list(indexes.get(table_name, {}).values())
+            indexed_columns = {i["columns"][0] for i in table_indexes}
+
             columns = []
-            for col in cursor.fetchall():
-                # col: Field, Type, Null, Key, Default, Extra
-                c_name = col[0]
-                c_type_raw = col[1].lower()
-                c_key = col[3]
-                
-                # Simplified Mapping
-                c_type = "TEXT"
-                if "int" in c_type_raw: c_type = "INTEGER"
-                elif "decimal" in c_type_raw: c_type = "DECIMAL"
-                elif "datetime" in c_type_raw: c_type = "DATETIME"
-                elif "char" in c_type_raw: c_type = "TEXT"
-                
+            for c_name, c_type_raw, c_key in raw_columns:
+                if isinstance(c_type_raw, (bytes, bytearray)):
+                    c_type_raw = c_type_raw.decode() # Some server/driver combos return TEXT columns as bytes
                 columns.append({
                     "name": c_name,
-                    "type": c_type,
+                    "type": map_column_type(c_type_raw.lower()),
                     "primary_key": c_key == 'PRI',
+                    "indexed": c_name in indexed_columns, # Leading column of some index
                     "description": "" 
                 })
             
             table_obj = {
                 "name": table_name,
                 "columns": columns,
-                "description": f"Table {table_name}"
+                "description": f"Table {table_name}",
+                "row_estimate": row_estimates.get(table_name),
+                "indexes": table_indexes,
             }
             
             schema_data[category].append(table_obj)
@@ -347,10 +584,58 @@ def inspect_db_schema() -> Dict:
         
     return schema_data
 
+# Introspection result is cached until /api/apply-schema runs or the
+# information_schema fingerprint (table count, create/update times) changes
+SCHEMA_FINGERPRINT_POLL_SECONDS = 5.0
+_schema_cache = {"fingerprint": None, "checked_at": 0.0, "payload": None, "etag": None}
+_schema_lock = threading.Lock()
+
+def read_schema_fingerprint() -> tuple:
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*), MAX(CREATE_TIME), MAX(UPDATE_TIME) FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        return tuple(str(v) for v in cursor.fetchone())
+    finally:
+        conn.close()
+
+def invalidate_schema_cache():
+    with _schema_lock:
+        _schema_cache.update(fingerprint=None, checked_at=0.0, payload=None, etag=None)
+
+def get_cached_schema():
+    # Returns (payload, etag)
+    with _schema_lock:
+        now = time.monotonic()
+        if _schema_cache["payload"] is not None and now - _schema_cache["checked_at"] < SCHEMA_FINGERPRINT_POLL_SECONDS:
+            return _schema_cache["payload"], _schema_cache["etag"]
+
+        fingerprint = read_schema_fingerprint()
+        if _schema_cache["payload"] is None or fingerprint != _schema_cache["fingerprint"]:
+            payload = inspect_db_schema()
+            if "debug_error" in payload:
+                # Don't pin a failed introspection in the cache
+                return payload, None
+            body = json.dumps(payload, sort_keys=True, default=str)
+            _schema_cache.update(
+                payload=payload,
+                etag='"' + hashlib.sha1(body.encode()).hexdigest() + '"',
+                fingerprint=fingerprint,
+            )
+        _schema_cache["checked_at"] = now
+        return _schema_cache["payload"], _schema_cache["etag"]
+
 @app.get("/api/schema", response_model=Dict) 
-def get_schema():
-    # Direct DB Inspection
-    return inspect_db_schema()
+def get_schema(request: Request):
+    # Direct DB Inspection (cached, with ETag revalidation)
+    payload, etag = get_cached_schema()
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+    return JSONResponse(content=jsonable_encoder(payload), headers=headers)
 
 @app.post("/api/schema")
 def update_schema(schema: Schema):
@@ -461,22 +746,56 @@ def apply_schema():
     finally:
         conn.close()
 
+    invalidate_schema_cache()
     return {"status": "success", "message": "Schema synced to MySQL database (Created missing tables & Added missing columns)"}
 
 @app.get("/api/reports")
-def get_reports():
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def get_reports(request: Request):
     try:
-        cursor.execute("SELECT config FROM bi_reports")
-        reports = [json.loads(row[0]) for row in cursor.fetchall()]
-        return {"reports": reports}
+        reports = report_registry.all()
+        etag = make_etag("reports", report_registry.version, [(r.raw.get("id"), r.config_hash) for r in reports])
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        return FastJSONResponse({"reports": [r.raw for r in reports]}, headers={"ETag": etag, "Cache-Control": "no-cache"})
     except Exception as e:
         print(f"Error fetching reports: {e}")
         return {"reports": [], "error": str(e)}
+
+@app.post("/api/reports/dry-run")
+def dry_run_report(request: DryRunRequest):
+    # Used by the ReportEditor before saving: shows the compiled SQL and what
+    # MySQL expects it to cost, without running it
+    report = request.report
+    query = QueryRequest(report_id=report.id, filters=request.filters, granularity=request.granularity,
+                         start=request.start, end=request.end, sample=request.sample)
+    sql, params = compile_report_sql(report, query)
+
+    conn = get_db_connection()
+    try:
+        analysis = query_guard.analyze_plan(query_guard.explain(conn, sql, params))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"SQL Error: {str(e)}")
     finally:
         conn.close()
 
+    # Approximate preview for the editor; exact numbers only once the report is saved
+    preview = None
+    if request.sample and report.source_table in sampled_tables():
+        preview = run_sample_query(report, query)
+
+    return {
+        "sql": sql,
+        "params": params,
+        "preview": preview,
+        "estimated_rows": analysis["estimated_rows"],
+        "full_scans": analysis["full_scans"],
+        "indexes_used": analysis["indexes_used"],
+        "warnings": analysis["warnings"],
+        "would_reject": bool(analysis["warnings"]) and query_guard.GUARD_MODE == "reject",
+        "max_execution_time_ms": query_guard.execution_time_limit(report),
+        "plan": analysis["plan"],
+    }
+
 @app.post("/api/reports")
 def save_report(report: ReportConfig):
     conn = get_db_connection()
@@ -497,6 +816,8 @@ def save_report(report: ReportConfig):
         """
         cursor.execute(sql, (report.id, report.category, report.title, report.description, config_json))
         conn.commit()
+        report_registry.mark_changed(conn)
+        result_cache.invalidate_report(report.id)
         return {"status": "success", "message": "Report saved"}
     except Exception as e:
         print(f"Error saving report: {e}")
@@ -511,6 +832,8 @@ def delete_report(report_id: str):
     try:
         cursor.execute("DELETE FROM bi_reports WHERE id = %s", (report_id,))
         conn.commit()
+        report_registry.mark_changed(conn)
+        result_cache.invalidate_report(report_id)
         return {"status": "success", "message": "Report deleted"}
     except Exception as e:
         print(f"Error deleting report: {e}")
@@ -518,39 +841,313 @@ def delete_report(report_id: str):
     finally:
         conn.close()
 
-@app.delete("/api/reports/{report_id}")
-def delete_report(report_id: str):
-    data = get_reports() 
-    if isinstance(data, dict):
-         reports = data.get("reports", [])
-    else:
-         reports = []
-         
-    reports = [r for r in reports if r["id"] != report_id]
-    
-    new_data = {"reports": reports}
-    
-    # Save to File
-    with open(REPORTS_FILE, "w") as f:
-        json.dump(new_data, f, indent=2)
-    # Save to DB
-    set_metadata("bi_reports", new_data)
-        
-    return {"status": "success"}
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/snapshots")
+def get_snapshots():
+    snapshots = []
+    for version in reversed(snapshot_versions()):
+        manifest = load_manifest(version)
+        snapshots.append({
+            "version": version,
+            "created_at": manifest["created_at"],
+            "tables": {name: sum(f["rows"] for f in t["files"]) for name, t in manifest["tables"].items()},
+        })
+    return {"current_version": get_data_version(), "snapshots": snapshots}
+
+@app.get("/api/debug/slow-queries")
+def get_slow_queries(since_hours: int = 24, limit: int = 50):
+    # Slowest statement shapes first (by total time spent)
+    conn = get_db_connection()
+    try:
+        return {
+            "threshold_ms": slow_query_log.SLOW_QUERY_THRESHOLD_MS,
+            "queries": slow_query_log.slow_query_summary(conn, max(since_hours, 1), min(max(limit, 1), 500)),
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        conn.close()
+
+@app.post("/api/query", response_class=FastJSONResponse)
+async def execute_query(query: QueryRequest, request: Request, format: Optional[str] = None):
+    if not query.sample:
+        query_usage.record(query.report_id, query.filters, query.granularity)
+    arrow = wants_arrow(format, request.headers.get("accept"))
+    if arrow and not arrow_available():
+        raise HTTPException(status_code=406, detail="Arrow responses need pyarrow installed on the server")
+    report, cache_key = await run_in_threadpool(prepare_query, query)
+    # The cache key already covers config hash, filters, range and data version
+    etag = make_etag("query", cache_key, "arrow" if arrow else "json")
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    result = await answer_prepared(query, report, cache_key, request)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if arrow:
+        return Response(content=encode_arrow(result), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    # Already plain lists/strings/floats, so skip jsonable_encoder
+    return FastJSONResponse(result, headers=headers)
+
+@app.post("/api/query/batch", response_class=FastJSONResponse)
+async def execute_query_batch(batch: BatchQueryRequest, request: Request):
+    # One round trip for a whole dashboard: every query runs concurrently
+    # (bounded by the "query" semaphore) and, when streaming, each result is
+    # written as an NDJSON line as soon as it is ready.
+    for item in batch.queries:
+        query_usage.record(item.report_id, item.filters, item.granularity)
+    prepared = await run_in_threadpool(prepare_batch, batch.queries)
+
+    async def run_unit(unit: List[Dict]) -> List[Dict]:
+        try:
+            if len(unit) == 1:
+                p = unit[0]
+                if p["error"]:
+                    raise p["error"]
+                results = {p["cache_key"]: await answer_prepared(p["item"], p["report"], p["cache_key"], request)}
+            else:
+                results = await answer_shared_scan(unit, request)
+            return [
+                {"key": item.key or item.report_id, "report_id": item.report_id, "result": results[p["cache_key"]]}
+                for p in unit for item in p["items"]
+            ]
+        except HTTPException as e:
+            return unit_error(unit, e.detail, e.status_code)
+        except Exception as e:
+            # Anything unexpected (pool exhaustion, DuckDB / Arrow errors) only fails this unit's charts
+            print(f"Batch query error: {e}")
+            return unit_error(unit, str(e), 500)
+
+    units = await run_in_threadpool(plan_batch, prepared)
+
+    if not batch.stream:
+        unit_results = await asyncio.gather(*(run_unit(unit) for unit in units))
+        return FastJSONResponse({"results": {item["key"]: item for items in unit_results for item in items}})
+
+    async def stream_results():
+        tasks = [asyncio.ensure_future(run_unit(unit)) for unit in units]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                for item in await next_done:
+                    yield encode_json(item) + b"\n"
+        finally:
+            # Client went away mid-stream: stop (and KILL) whatever is left
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+def unit_error(unit: List[Dict], detail, status: int) -> List[Dict]:
+    return [
+        {"key": item.key or item.report_id, "report_id": item.report_id, "error": detail, "status": status}
+        for p in unit for item in p["items"]
+    ]
+
+def prepare_batch(items: List[BatchQueryItem]) -> List[Dict]:
+    # Resolve every item once; identical queries (same cache key) collapse
+    # into one entry that answers all of their items
+    by_cache_key = {}
+    prepared = []
+    for item in items:
+        try:
+            report, cache_key = prepare_query(item)
+        except HTTPException as e:
+            prepared.append({"items": [item], "report": None, "cache_key": None, "error": e})
+            continue
+        if cache_key in by_cache_key:
+            by_cache_key[cache_key]["items"].append(item)
+            continue
+        entry = {"items": [item], "item": item, "report": report, "cache_key": cache_key, "error": None}
+        by_cache_key[cache_key] = entry
+        prepared.append(entry)
+    return prepared
+
+def shared_scan_signature(report: ReportConfig, query: QueryRequest) -> tuple:
+    # Reports with the same signature scan the same rows into the same groups
+    # and only differ in what they compute per group
+    return (
+        report.source_table,
+        json.dumps([j.dict() for j in report.joins], sort_keys=True),
+        report.base_where or "",
+        resolve_group_expression(report, query.granularity),
+        normalize_filters(query.filters),
+        resolve_time_range(report, query),
+        query.snapshot_version,
+        query.exact,
+        # Each member keeps its own MAX_EXECUTION_TIME
+        query_guard.execution_time_limit(report),
+    )
+
+def takes_base_table_path(report: ReportConfig, query: QueryRequest) -> bool:
+    # True when route_report_query would run the report's own SQL on the base
+    # tables. Merging it with others can't lose a faster route then; a merged
+    # select list would fit none of the sketch / rollup / mirror rewrites.
+    if query.snapshot_version is not None or query.sample:
+        return False
+    if not query.exact and report.source_table in sketched_tables() and hll_sketches.build_sketch_sql(
+            report, resolve_group_expression(report, query.granularity), query.filters, resolve_time_range(report, query)):
+        return False
+    if mirror_report_sql(report, query) is not None:
+        return False
+    if SNAPSHOTS_ENABLED and snapshots_queryable() and is_historical_query(report, query):
+        return False
+    return rollup_report_sql(report, query) is None
+
+def plan_batch(prepared: List[Dict]) -> List[List[Dict]]:
+    # Split a batch into execution units: cached or unique queries run alone,
+    # uncached base-table reports sharing a scan signature run as one merged SELECT
+    units = []
+    groups = {}
+    for p in prepared:
+        if p["error"] or result_cache.get(p["cache_key"]) is not None or not SHARED_SCAN_ENABLED \
+                or p["item"].sample or p["item"].split_by or p["item"].compare \
+                or not takes_base_table_path(p["report"], p["item"]):
+            units.append([p])
+            continue
+        groups.setdefault(shared_scan_signature(p["report"], p["item"]), []).append(p)
+    units.extend(groups.values())
+    return units
+
+def merge_report_measures(reports: List[ReportConfig]):
+    # Combine every report's measures into one select list with unique aliases.
+    # Returns (measure_sql, splits) where splits[i] lists (alias, series name)
+    # for reports[i] in their original column order.
+    terms = []
+    splits = []
+    for r_idx, report in enumerate(reports):
+        split = []
+        for t_idx, term in enumerate(split_top_level(report.measure_formula or "")):
+            expr, alias = split_alias(term)
+            merged_alias = f"m{r_idx}_{t_idx}"
+            terms.append(f"{expr} AS `{merged_alias}`")
+            # Series name MySQL would have used for the standalone query
+            split.append((merged_alias, alias if alias is not None else expr))
+        splits.append(split)
+    return ", ".join(terms), splits
+
+def split_shared_result(result: Dict, splits) -> List[Dict]:
+    series_by_name = {s["name"]: s["data"] for s in result["series"]}
+    return [
+        {
+            "x_axis": list(result["x_axis"]),
+            "series": [{"name": name, "data": series_by_name[alias]} for alias, name in split],
+        }
+        for split in splits
+    ]
+
+async def answer_shared_scan(unit: List[Dict], request: Request) -> Dict:
+    reports = [p["report"] for p in unit]
+    measure_sql, splits = merge_report_measures(reports)
+    merged = reports[0].copy(update={"measure_formula": measure_sql})
+    query = unit[0]["item"]
+
+    # Every member takes the base-table path (see plan_batch), so skip the routing
+    handle = QueryHandle()
+    result = await run_cancellable(
+        request, "query",
+        lambda: run_mysql_report_query(merged, query, handle, build_report_sql(merged, query), members=reports),
+        handle,
+    )
+
+    results = {}
+    for p, split_result in zip(unit, split_shared_result(result, splits)):
+        result_cache.put(p["cache_key"], split_result)
+        results[p["cache_key"]] = split_result
+    return results
+
+async def answer_prepared(query: QueryRequest, report: ReportConfig, cache_key: tuple, request: Request):
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Requests coalesced on the same cache key share one handle, so the
+    # statement is only killed once every one of them has gone away
+    handle = acquire_shared_handle(cache_key)
+    return await run_cancellable(
+        request, "query",
+        lambda: result_cache.get_or_compute(cache_key, lambda: compute_report_result(report, query, cache_key, handle)),
+        handle,
+        release=lambda: release_shared_handle(cache_key, handle),
+    )
 
-@app.post("/api/query")
-def execute_query(query: QueryRequest):
-    reports_data = get_reports()
-    report_dict = next((r for r in reports_data.get("reports", []) if r["id"] == query.report_id), None)
+def prepare_query(query: QueryRequest):
+    entry = report_registry.get(query.report_id)
     
-    if not report_dict:
+    if not entry:
         raise HTTPException(status_code=404, detail="Report not found")
+    if entry.config is None:
+        raise HTTPException(status_code=400, detail="Report config is invalid")
     
-    report = ReportConfig(**report_dict)
+    report = entry.config
 
-    source_table = report.source_table
-    measure_formula = report.measure_formula
-    
+    if query.sample and query.snapshot_version is not None:
+        raise HTTPException(status_code=400, detail="sample and snapshot_version can't be combined")
+    # Snapshots never change, so a pinned query is keyed on the snapshot instead of the live data version
+    if query.snapshot_version is not None:
+        version = ("snapshot", query.snapshot_version)
+    else:
+        version = get_data_version()
+    split = None
+    if query.split_by:
+        if query.split_by not in report.slices:
+            raise HTTPException(status_code=400, detail=f"split_by must be one of the report's slices: {report.slices}")
+        if query.sample:
+            raise HTTPException(status_code=400, detail="sample and split_by can't be combined")
+        split = (query.split_by, clamp_split_limit(query.split_limit))
+    if query.compare:
+        plan_compare(report, query)
+    variant = "sample" if query.sample else "exact" if query.exact else ""
+    cache_key = make_cache_key(report.id, entry.config_hash, query.filters, query.granularity, version,
+                               resolve_time_range(report, query), variant, split, query.compare)
+    return report, cache_key
+
+def report_time_column(report: ReportConfig) -> Optional[str]:
+    # Raw datetime column behind the report's time axis, e.g. pay_time for
+    # DATE_FORMAT(pay_time, '%Y-%m') or join_date for a bare join_date group_by
+    column = report.time_column
+    if not column:
+        group_by = (report.group_by or "").strip()
+        m = re.match(r"^DATE_FORMAT\(\s*([\w.`]+)\s*,", group_by, flags=re.IGNORECASE)
+        column = m.group(1) if m else group_by
+        column = column.replace("`", "")
+        # time_key and similar surrogate keys are not datetimes
+        if not re.fullmatch(r"(\w+\.)?\w+", column) or column.endswith("_key") \
+                or not ("time" in column.lower() or "date" in column.lower()):
+            return None
+    if "." in column:
+        table, col = column.split(".", 1)
+        return f"`{table}`.`{col}`"
+    return f"`{report.source_table}`.`{column}`"
+
+def parse_time_bound(value: str) -> str:
+    try:
+        return datetime.fromisoformat(value.strip()).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time bound: {value}")
+
+def resolve_time_range(report: ReportConfig, query: QueryRequest) -> Optional[tuple]:
+    # (column, start, end) as a half-open range, or None for all history
+    start = parse_time_bound(query.start) if query.start else None
+    end = parse_time_bound(query.end) if query.end else None
+    if not start and not end and report.default_window_days:
+        # Whole days so the range (and the cache key) is stable for the day
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = today - timedelta(days=report.default_window_days - 1)
+        # From the start of its bucket, so a monthly / yearly chart doesn't open on a partial one
+        bucket = date_bucket(report, query)
+        if bucket:
+            window_start = window_start.replace(**BUCKET_STARTS[bucket[1]])
+        start = window_start.strftime("%Y-%m-%d %H:%M:%S")
+    if not start and not end:
+        return None
+
+    column = report_time_column(report)
+    if not column:
+        raise HTTPException(status_code=400, detail="Report has no time column for start/end")
+    return (column, start, end)
+
+def resolve_group_expression(report: ReportConfig, granularity: str) -> str:
     config_group_by = report.group_by
     
     # Granularity Logic
@@ -558,22 +1155,44 @@ def execute_query(query: QueryRequest):
     # Otherwise, apply default string slicing if granularity is requested.
     group_expression = config_group_by
     
-    if query.granularity and "(" not in config_group_by:
+    if granularity and "(" not in config_group_by:
          if "time" in config_group_by.lower() or "date" in config_group_by.lower():
-            if query.granularity == "year":
+            if granularity == "year":
                 group_expression = f"DATE_FORMAT({config_group_by}, '%Y')"
-            elif query.granularity == "month":
+            elif granularity == "month":
                 group_expression = f"DATE_FORMAT({config_group_by}, '%Y-%m')"
-            elif query.granularity == "day":
+            elif granularity == "day":
                 group_expression = f"DATE_FORMAT({config_group_by}, '%Y-%m-%d')"
     
+    return group_expression
+
+def build_report_sql(report: ReportConfig, query: QueryRequest, date_keys: bool = True):
+    source_table = report.source_table
+    measure_formula = report.measure_formula
+    
+    group_expression = resolve_group_expression(report, query.granularity)
+    group_by = "x_result"
+    
     join_clause = ""
     for j in report.joins:
         join_clause += f" {j.join_type} JOIN `{j.table}` ON {j.on_expression}"
+
+    if date_keys and source_table in date_key_tables():
+        bucket = bucket_by_date_key(report, group_expression)
+        if bucket:
+            group_expression, date_join, group_by = bucket
+            join_clause += date_join
         
+    split_select = ""
+    if query.split_by:
+        # Pivoted into one series per value by build_series
+        split_select = f"`{source_table}`.`{query.split_by}` as {SPLIT_COLUMN},"
+        group_by += f", {SPLIT_COLUMN}"
+
     sql = f"""
         SELECT 
             {group_expression} as x_result, 
+            {split_select}
             {measure_formula} 
         FROM `{source_table}`
         {join_clause}
@@ -596,6 +1215,17 @@ def execute_query(query: QueryRequest):
                 where_clauses.append(f"{prefixed_col} = %s")
                 params.append(val)
             
+    time_range = resolve_time_range(report, query)
+    if time_range:
+        # Range on the raw column (not the formatted bucket) so MySQL can use its index
+        column, start, end = time_range
+        if start:
+            where_clauses.append(f"{column} >= %s")
+            params.append(start)
+        if end:
+            where_clauses.append(f"{column} < %s")
+            params.append(end)
+            
     if where_clauses:
         sql += " WHERE " + " AND ".join(where_clauses)
         
@@ -605,80 +1235,692 @@ def execute_query(query: QueryRequest):
         else:
             sql += f" WHERE ({report.base_where})"
         
-    sql += f" GROUP BY x_result ORDER BY x_result"
+    sql += f" GROUP BY {group_by} ORDER BY x_result"
     
-    print(f"Executing SQL: {sql} | Params: {params}") 
+    return sql, params
+
+def date_key_tables() -> List[str]:
+    if not DATE_KEYS_ENABLED:
+        return []
+    version = get_data_version()
+    if _date_key_state["version"] != version:
+        conn = get_db_connection()
+        try:
+            _date_key_state["tables"] = existing_date_keys(conn)
+        except Exception as e:
+            print(f"Warning: Failed to read date key columns: {e}")
+            _date_key_state["tables"] = []
+        finally:
+            conn.close()
+        _date_key_state["version"] = version
+    return _date_key_state["tables"]
+
+def use_rollups() -> bool:
+    if not ROLLUPS_ENABLED:
+        return False
+    version = get_data_version()
+    if _rollup_state["version"] != version:
+        conn = get_db_connection()
+        try:
+            _rollup_state["ready"] = rollups_ready(conn)
+        except Exception as e:
+            print(f"Warning: Failed to read rollup state: {e}")
+            _rollup_state["ready"] = False
+        finally:
+            conn.close()
+        _rollup_state["version"] = version
+    return _rollup_state["ready"]
+
+def rollup_report_sql(report: ReportConfig, query: QueryRequest) -> Optional[tuple]:
+    if not use_rollups():
+        return None
+    return build_rollup_sql(report, resolve_group_expression(report, query.granularity), query.filters,
+                            resolve_time_range(report, query), query.split_by)
+
+def compile_report_sql(report: ReportConfig, query: QueryRequest):
+    # Prefer the daily rollup when the report is compatible with it
+    return rollup_report_sql(report, query) or build_report_sql(report, query)
+
+def date_bucket(report: ReportConfig, query: QueryRequest) -> Optional[tuple]:
+    # (column, format) when the x axis is DATE_FORMAT(column, <a BUCKET_STARTS format>)
+    group_expression = resolve_group_expression(report, query.granularity).strip()
+    m = re.match(r"^DATE_FORMAT\(\s*([\w.`]+)\s*,\s*'([^']+)'\s*\)$", group_expression, flags=re.IGNORECASE)
+    if not m or m.group(2) not in BUCKET_STARTS:
+        return None
+    return m.group(1).replace("`", ""), m.group(2)
+
+def plan_incremental_refresh(report: ReportConfig, query: QueryRequest, cache_key: tuple):
+    # (result cached under the previous data version, first bucket label to
+    # recompute, query for the buckets from there on), or None to run in full
+    state = _incremental_state
+    # Top-N split values can change with the new rows; compared series are
+    # re-aligned as a whole
+    # Sampled results are cheap to rerun and their error bars don't splice
+    if state["version"] != cache_key[4] or not state["low_watermarks"] or query.split_by or query.compare \
+            or query.sample:
+        return None
+    base = state["bases"].get(base_cache_key(cache_key))
+    if base is None:
+        return None
+
+    low_watermarks = state["low_watermarks"]
+    if any(j.table in low_watermarks for j in report.joins):
+        return None
+    if report.source_table not in low_watermarks:
+        # Nothing this report reads has changed
+        return base, None, None
+
+    column, since = low_watermarks[report.source_table]
+    bucket = date_bucket(report, query)
+    if not bucket:
+        return None
+    group_column, fmt = bucket
+    if group_column not in (column, f"{report.source_table}.{column}"):
+        return None
+
+    # Buckets before the one holding the watermark are closed
+    try:
+        cutoff = datetime.fromisoformat(str(since)).replace(**BUCKET_STARTS[fmt])
+    except ValueError:
+        return None
+    cutoff_bound = cutoff.strftime("%Y-%m-%d %H:%M:%S")
+    time_range = resolve_time_range(report, query)
+    if time_range:
+        range_column, start, end = time_range
+        if range_column != f"`{report.source_table}`.`{column}`":
+            return None
+        if end and end <= cutoff_bound:
+            return base, None, None
+        if start and start >= cutoff_bound:
+            return None
+    return base, cutoff.strftime(fmt), query.copy(update={"start": cutoff_bound})
+
+def merge_incremental(base: Dict, recent: Dict, cutoff_label: str) -> Optional[Dict]:
+    names = [s["name"] for s in base["series"]]
+    if [s["name"] for s in recent["series"]] != names:
+        return None
+    # NULL buckets sort first and are left as they were
+    keep = [i for i, x in enumerate(base["x_axis"]) if x is None or str(x) < cutoff_label]
+
+    def merge_series(old: Dict, new: Dict) -> Dict:
+        # Per-bucket lists (data, error bars) are spliced; anything else
+        # (flags like scaled) comes from the fresh result
+        merged = dict(new)
+        for key, value in new.items():
+            old_value = old.get(key)
+            if isinstance(value, list) and isinstance(old_value, list) and len(old_value) == len(base["x_axis"]):
+                merged[key] = [old_value[i] for i in keep] + value
+        return merged
+
+    return {
+        **recent,
+        "x_axis": [base["x_axis"][i] for i in keep] + recent["x_axis"],
+        "series": [merge_series(old, new) for old, new in zip(base["series"], recent["series"])],
+    }
+
+def compute_report_result(report: ReportConfig, query: QueryRequest, cache_key: tuple, handle: Optional[QueryHandle] = None) -> Dict:
+    plan = plan_incremental_refresh(report, query, cache_key)
+    if plan:
+        base, cutoff_label, recent_query = plan
+        if recent_query is None:
+            return base
+        merged = merge_incremental(base, run_report_query(report, recent_query, handle), cutoff_label)
+        if merged is not None:
+            print(f"Incremental refresh of {report.id} from {cutoff_label}")
+            return merged
+    return run_report_query(report, query, handle)
+
+# Period-over-period comparison (see period_compare.py)
+def plan_compare(report: ReportConfig, query: QueryRequest) -> Dict:
+    # Bucket labels of both periods and the queries that read them
+    if query.compare not in COMPARE_LABELS:
+        raise HTTPException(status_code=400, detail=f"compare must be one of {list(COMPARE_LABELS)}")
+    bucket = date_bucket(report, query)
+    time_range = resolve_time_range(report, query)
+    if not bucket or not time_range or not time_range[1]:
+        raise HTTPException(status_code=400, detail="compare needs a date bucketed report and a start (or default window)")
+    start = datetime.fromisoformat(time_range[1])
+    if time_range[2]:
+        end = datetime.fromisoformat(time_range[2])
+    else:
+        end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    plan = plan_periods(start, end, bucket[1], query.compare)
+    if plan is None:
+        raise HTTPException(status_code=400, detail="compare needs a non-empty start..end range")
+    plan["queries"] = [query.copy(update={"compare": None, "start": s, "end": e}) for s, e in plan["ranges"]]
+    return plan
+
+def run_compare_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None) -> Dict:
+    # Both periods from one aggregate when they touch, else one per period
+    plan = plan_compare(report, query)
+    results = [run_report_query(report, q, handle) for q in plan["queries"]]
+    return align_compare(merge_period_results(results), plan, query.compare)
+
+# Background cache warm-up (see cache_warmup.py)
+WARMUP_ENABLED = True
+query_usage = QueryUsage()
+
+def list_warmup_queries() -> List[QueryRequest]:
+    # Every saved report's default query, then its most used filter combinations
+    # Reports with an invalid config are kept in the registry but can't be run
+    queries = [QueryRequest(report_id=entry.config.id) for entry in report_registry.all() if entry.config is not None]
+    conn = get_db_connection()
+    try:
+        query_usage.flush(conn)
+        for report_id, payload in query_usage.top_queries(conn, WARMUP_TOP_QUERIES_PER_REPORT):
+            if report_registry.get(report_id):
+                queries.append(QueryRequest(report_id=report_id, **payload))
+    except Exception as e:
+        print(f"Warning: Failed to read query usage: {e}")
+    finally:
+        conn.close()
+    return queries
+
+def warm_query(query: QueryRequest):
+    report, cache_key = prepare_query(query)
+    result_cache.get_or_compute(cache_key, lambda: compute_report_result(report, query, cache_key), WARMUP_TTL_SECONDS)
+
+def flush_query_usage():
+    if not query_usage.flush_due():
+        return
+    conn = get_db_connection()
+    try:
+        query_usage.flush(conn)
+    finally:
+        conn.close()
+
+cache_warmer = CacheWarmer(get_data_version, list_warmup_queries, warm_query, on_poll=flush_query_usage)
+
+@app.on_event("startup")
+def start_cache_warmup():
+    if WARMUP_ENABLED:
+        cache_warmer.start()
+
+# Answer compatible reports from the DuckDB mirror (see columnar_mirror.py)
+MIRROR_ENABLED = True
+# Share of answers from a verified report shape that are still re-checked on MySQL
+MIRROR_VERIFY_SAMPLE_RATE = 0.02
+mirror_reader = MirrorReader()
+# Per data version: report shapes whose mirror answer matched MySQL, and
+# reports whose answer disagreed. DuckDB differs from MySQL on NULL ordering,
+# collation and integer division, so a shape is only served from the mirror
+# after it has been checked once.
+_mirror_blocked = {"version": None, "reports": set(), "verified": set()}
+
+def mirror_shape(report: ReportConfig, query: QueryRequest) -> tuple:
+    return (report.id, query.granularity, query.split_by)
+
+def mirror_report_sql(report: ReportConfig, query: QueryRequest):
+    if not MIRROR_ENABLED or not mirror_available():
+        return None
+    version = get_data_version()
+    if _mirror_blocked["version"] != version:
+        _mirror_blocked.update(version=version, reports=set(), verified=set())
+    if report.id in _mirror_blocked["reports"]:
+        return None
+    try:
+        if not mirror_reader.ready_for(version):
+            return None
+    except Exception as e:
+        print(f"Warning: Failed to open columnar mirror: {e}")
+        return None
+    # Plain SQL on the raw columns; the rollup / date key rewrites are MySQL-side tricks
+    sql, params = build_report_sql(report, query, date_keys=False)
+    mirror_sql = translate_sql(sql, mirror_reader.tables)
+    return (mirror_sql, params) if mirror_sql else None
+
+def results_match(a: Dict, b: Dict) -> bool:
+    if [str(x) for x in a["x_axis"]] != [str(x) for x in b["x_axis"]]:
+        return False
+    if [s["name"] for s in a["series"]] != [s["name"] for s in b["series"]]:
+        return False
+    return all(
+        abs(x - y) <= 1e-6 * max(1.0, abs(x), abs(y))
+        for sa, sb in zip(a["series"], b["series"]) for x, y in zip(sa["data"], sb["data"])
+    )
+
+# Serve long-range queries from the latest Parquet snapshot (see parquet_snapshots.py)
+SNAPSHOTS_ENABLED = True
+# Ranges starting this far back (or unbounded) count as historical
+SNAPSHOT_MIN_RANGE_DAYS = 365
+
+def is_historical_query(report: ReportConfig, query: QueryRequest) -> bool:
+    time_range = resolve_time_range(report, query)
+    if not time_range or not time_range[1]:
+        return True
+    cutoff = datetime.now() - timedelta(days=SNAPSHOT_MIN_RANGE_DAYS)
+    return time_range[1] <= cutoff.strftime("%Y-%m-%d %H:%M:%S")
+
+def run_snapshot_query(report: ReportConfig, query: QueryRequest, version: int) -> Optional[Dict]:
+    # None when the snapshot can't express this report
+    sql, params = build_report_sql(report, query, date_keys=False)
+    duck_sql = snapshot_sql(sql, version, report.source_table, query.filters, resolve_time_range(report, query))
+    if duck_sql is None:
+        return None
+    start_ts = time.perf_counter()
+    columns, rows = execute_snapshot_query(duck_sql, params)
+    metrics.log_query(report.id, duck_sql, params, time.perf_counter() - start_ts, len(rows))
+    return build_series(columns, rows)
+
+def run_pinned_snapshot_query(report: ReportConfig, query: QueryRequest) -> Dict:
+    if not snapshots_queryable():
+        raise HTTPException(status_code=501, detail="Snapshot queries need duckdb installed on the server")
+    if load_manifest(query.snapshot_version) is None:
+        raise HTTPException(status_code=404, detail=f"Snapshot {query.snapshot_version} not found")
+    try:
+        result = run_snapshot_query(report, query, query.snapshot_version)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=400, detail="Report can't be answered from a snapshot")
+    return result
+
+def run_historical_query(report: ReportConfig, query: QueryRequest) -> Optional[Dict]:
+    if not SNAPSHOTS_ENABLED or not snapshots_queryable() or not is_historical_query(report, query):
+        return None
+    versions = snapshot_versions()
+    # Only the snapshot of the live data version gives the same numbers as MySQL
+    if not versions or versions[-1] != get_data_version():
+        return None
+    try:
+        return run_snapshot_query(report, query, versions[-1])
+    except Exception as e:
+        print(f"Warning: Snapshot query for {report.id} failed, using MySQL: {e}")
+        return None
+
+# Sampled previews (see sampling.py)
+SAMPLING_ENABLED = True
+_sample_state = {"version": None, "tables": []}
+
+def sampled_tables() -> List[str]:
+    if not SAMPLING_ENABLED:
+        return []
+    version = get_data_version()
+    if _sample_state["version"] != version:
+        conn = get_db_connection()
+        try:
+            _sample_state["tables"] = sampling.sample_tables(conn, version)
+        except Exception as e:
+            print(f"Warning: Failed to read sample state: {e}")
+            _sample_state["tables"] = []
+        finally:
+            conn.close()
+        _sample_state["version"] = version
+    return _sample_state["tables"]
+
+def run_sample_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None) -> Dict:
+    # Joined tables are read in full, only the source table is sampled
+    if report.source_table not in sampled_tables():
+        result = run_mysql_report_query(report, query, handle)
+        return {**result, "sample": None}
+    measure_sql, outputs = sampling.plan_sample_measures(report.measure_formula)
+    sampled = report.copy(update={"measure_formula": measure_sql})
+    sql, params = build_report_sql(sampled, query, date_keys=False)
+    result = run_mysql_report_query(sampled, query, handle, (sampling.sample_source(sql, report.source_table), params))
+    return sampling.scale_sample_result(result, outputs)
+
+# COUNT(DISTINCT) measures from daily HLL sketches (see hll_sketches.py)
+SKETCHES_ENABLED = True
+_sketch_state = {"version": None, "tables": []}
+
+def sketched_tables() -> List[str]:
+    if not SKETCHES_ENABLED:
+        return []
+    version = get_data_version()
+    if _sketch_state["version"] != version:
+        conn = get_db_connection()
+        try:
+            _sketch_state["tables"] = hll_sketches.sketch_tables(conn, version)
+        except Exception as e:
+            print(f"Warning: Failed to read sketch state: {e}")
+            _sketch_state["tables"] = []
+        finally:
+            conn.close()
+        _sketch_state["version"] = version
+    return _sketch_state["tables"]
+
+def run_sketch_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None) -> Optional[Dict]:
+    if query.split_by or report.source_table not in sketched_tables():
+        return None
+    planned = hll_sketches.build_sketch_sql(report, resolve_group_expression(report, query.granularity), query.filters,
+                                            resolve_time_range(report, query))
+    if not planned:
+        return None
+    sql, params, measures = planned
+    return run_mysql_report_query(report, query, handle, (sql, params),
+                                  build=lambda columns, rows: hll_sketches.merge_sketch_rows(rows, measures))
+
+def run_report_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None) -> Dict:
+    if query.compare:
+        return run_compare_query(report, query, handle)
+    result = route_report_query(report, query, handle)
+    if query.split_by:
+        result = fold_split_series(result, clamp_split_limit(query.split_limit))
+    return result
+
+def route_report_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None) -> Dict:
+    if query.snapshot_version is not None:
+        return run_pinned_snapshot_query(report, query)
+    if query.sample:
+        return run_sample_query(report, query, handle)
+    if not query.exact:
+        sketched = run_sketch_query(report, query, handle)
+        if sketched is not None:
+            return sketched
+    mirror = mirror_report_sql(report, query)
+    if mirror:
+        mirror_sql, params = mirror
+        try:
+            start_ts = time.perf_counter()
+            columns, rows = mirror_reader.execute(mirror_sql, params)
+            duration = time.perf_counter() - start_ts
+            metrics.mirror_queries.inc("mirror")
+            metrics.log_query(report.id, mirror_sql, params, duration, len(rows))
+            result = build_series(columns, rows)
+        except Exception as e:
+            print(f"Warning: Mirror query for {report.id} failed, using MySQL: {e}")
+            metrics.mirror_queries.inc("fallback")
+        else:
+            shape = mirror_shape(report, query)
+            if shape in _mirror_blocked["verified"] and random.random() >= MIRROR_VERIFY_SAMPLE_RATE:
+                return result
+            # MySQL is the oracle; an unverified shape is answered from it
+            expected = run_mysql_report_query(report, query, handle)
+            if results_match(result, expected):
+                _mirror_blocked["verified"].add(shape)
+            else:
+                print(f"Warning: Mirror result for {report.id} differs from MySQL, disabled for this data version")
+                metrics.mirror_queries.inc("mismatch")
+                _mirror_blocked["reports"].add(report.id)
+                _mirror_blocked["verified"].discard(shape)
+            return expected
+    historical = run_historical_query(report, query)
+    if historical is not None:
+        return historical
+    return run_mysql_report_query(report, query, handle)
+
+# Server-side pivot for split_by
+SPLIT_COLUMN = "split_value"
+SPLIT_OTHER_LABEL = "Other"
+MAX_SPLIT_LIMIT = 50
+
+def clamp_split_limit(limit: int) -> int:
+    return max(1, min(limit, MAX_SPLIT_LIMIT))
+
+def split_label(value) -> str:
+    return "(empty)" if value is None or value == "" else str(value)
+
+def pivot_split_series(columns: List[str], rows: List[tuple]) -> Dict:
+    # (x_result, split_value, measures...) rows -> one series per split value
+    # and measure, aligned on x_result, missing buckets as 0. Values are ordered
+    # by the total of the first measure.
+    split_idx = columns.index(SPLIT_COLUMN)
+    measure_indices = [i for i, name in enumerate(columns) if name not in ('x_result', SPLIT_COLUMN)]
+    x_axis, x_pos = [], {}
+    cells: Dict[str, Dict] = {}
+    totals: Dict[str, float] = {}
+    for row in rows:
+        x = row[0]
+        if x not in x_pos:
+            x_pos[x] = len(x_axis)
+            x_axis.append(x)
+        label = split_label(row[split_idx])
+        values = [float(row[i]) if row[i] is not None else 0 for i in measure_indices]
+        bucket = cells.setdefault(label, {})
+        # NULL and '' share the "(empty)" label, so a bucket can repeat
+        previous = bucket.get(x_pos[x])
+        bucket[x_pos[x]] = [a + b for a, b in zip(previous, values)] if previous else values
+        totals[label] = totals.get(label, 0) + (values[0] if values else 0)
+
+    series = []
+    for label in sorted(cells, key=lambda l: -totals[l]):
+        for m, idx in enumerate(measure_indices):
+            data = [0] * len(x_axis)
+            for pos, values in cells[label].items():
+                data[pos] = values[m]
+            series.append({
+                "name": label if len(measure_indices) == 1 else f"{label} / {columns[idx]}",
+                "split": label,
+                "measure": columns[idx],
+                "data": data,
+            })
+    return {"x_axis": x_axis, "series": series}
+
+def fold_split_series(result: Dict, limit: int) -> Dict:
+    # Keep the top `limit` split values and sum the rest per measure into "Other"
+    labels = list(dict.fromkeys(s["split"] for s in result["series"]))
+    if len(labels) <= limit:
+        return result
+    kept = set(labels[:limit])
+    series = [s for s in result["series"] if s["split"] in kept]
+    other: Dict[str, List[float]] = {}
+    for s in result["series"]:
+        if s["split"] not in kept:
+            data = other.setdefault(s["measure"], [0] * len(result["x_axis"]))
+            for i, v in enumerate(s["data"]):
+                data[i] += v
+    single = len(other) == 1
+    for measure, data in other.items():
+        series.append({
+            "name": SPLIT_OTHER_LABEL if single else f"{SPLIT_OTHER_LABEL} / {measure}",
+            "split": SPLIT_OTHER_LABEL,
+            "measure": measure,
+            "data": data,
+        })
+    return {**result, "series": series}
+
+def build_series(columns: List[str], rows: List[tuple]) -> Dict:
+    if SPLIT_COLUMN in columns:
+        return pivot_split_series(columns, rows)
+    # Column arrays straight from the rows; x_result is first, every other column is a series
+    y_column_indices = [i for i, name in enumerate(columns) if name != 'x_result']
+    column_data = list(zip(*rows)) if rows else [()] * len(columns)
+    return {
+        "x_axis": list(column_data[0]),
+        "series": [
+            {
+                "name": columns[idx],
+                "data": numeric_column(column_data[idx])
+            } for idx in y_column_indices
+        ]
+    }
+
+def run_mysql_report_query(report: ReportConfig, query: QueryRequest, handle: Optional[QueryHandle] = None,
+                           compiled: Optional[tuple] = None, build=build_series,
+                           members: Optional[List[ReportConfig]] = None) -> Dict:
+    # members: the reports a shared scan answers, which metrics and logs are
+    # attributed to instead of the merged report
+    sql, params = compiled or compile_report_sql(report, query)
+    report_ids = [r.id for r in members or [report]]
 
     conn = get_db_connection()
     cursor = conn.cursor()
+    start_ts = None
     try:
-        cursor.execute(sql, tuple(params))
-        
-        # Get column names to identify series (anything besides x_result)
-        columns = [col[0] for col in cursor.description]
-        y_column_indices = [i for i, name in enumerate(columns) if name != 'x_result']
-        series_names = [columns[i] for i in y_column_indices]
-        
-        rows = cursor.fetchall()
-        
-        # Format X-Axis and Series
-        x_data = []
-        series_data = {name: [] for name in series_names}
+        query_guard.check_query(conn, sql, params, ", ".join(report_ids))
+        sql = query_guard.add_execution_hint(sql, query_guard.execution_time_limit(report))
+        if handle:
+            handle.attach(conn)
+        start_ts = time.perf_counter()
+        with metrics.mysql_statement("query"):
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+        duration = time.perf_counter() - start_ts
+        for report_id in report_ids:
+            metrics.report_query_seconds.observe(report_id, value=duration)
+            metrics.report_rows.observe(report_id, value=len(rows))
+            metrics.log_query(report_id, sql, params, duration, len(rows))
+            slow_query_log.record_if_slow(conn, "query", sql, params, duration, len(rows), report_id)
         
-        for row in rows:
-            x_data.append(row[0]) # x_result is first
-            for i, idx in enumerate(y_column_indices):
-                val = row[idx]
-                series_data[series_names[i]].append(float(val) if val is not None else 0)
-            
-        return {
-            "x_axis": x_data,
-            "series": [
-                {
-                    "name": name,
-                    "data": series_data[name]
-                } for name in series_names
-            ]
-        }
+        return build([col[0] for col in cursor.description], rows)
+    except query_guard.QueryRejected as e:
+        print(f"Query Rejected: {e}")
+        for report_id in report_ids:
+            metrics.report_errors.inc(report_id)
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        print(f"Query Error: {e}")
+        duration = time.perf_counter() - start_ts if start_ts else 0
+        for report_id in report_ids:
+            metrics.report_errors.inc(report_id)
+            metrics.log_query(report_id, sql, params, duration, None, error=str(e))
         raise HTTPException(status_code=400, detail=str(e))
     finally:
+        if handle:
+            handle.detach()
         conn.close()
 
 @app.get("/api/data/{table_name}")
-def get_table_data(table_name: str):
+async def get_table_data(table_name: str, request: Request, limit: int = table_browser.DEFAULT_PAGE_SIZE,
+                         after: Optional[str] = None, columns: Optional[str] = None, format: str = "json"):
+    # Keyset pagination: pass back next_cursor as ?after= to get the next page.
+    # format=ndjson streams every row from ?after= onwards without buffering.
     allowed_chars = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
     if not set(table_name).issubset(allowed_chars):
          raise HTTPException(status_code=400, detail="Invalid table name")
 
+    projection = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+
+    if format == "ndjson":
+        # Validate up front so errors still get a proper status code
+        sql, params, select_cols = await run_in_threadpool(plan_table_stream, table_name, projection, after)
+        return StreamingResponse(stream_table_data(sql, params, select_cols), media_type="application/x-ndjson")
+
+    handle = QueryHandle()
+    return await run_cancellable(
+        request, "data",
+        lambda: fetch_table_data(table_name, handle, table_browser.clamp_page_size(limit), after, projection),
+        handle,
+    )
+
+def prepare_table_scan(conn, table_name: str, projection: Optional[List[str]], after: Optional[str], limit: Optional[int]):
+    table_columns, pk_columns = table_browser.describe_table(conn, table_name)
+    if not table_columns:
+        raise HTTPException(status_code=404, detail="Table not found")
+    try:
+        sql, params, select_cols = table_browser.build_page_sql(table_name, table_columns, pk_columns, projection, after, limit)
+    except table_browser.TableBrowseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return sql, params, select_cols, pk_columns
+
+def fetch_table_data(table_name: str, handle: Optional[QueryHandle] = None, limit: int = table_browser.DEFAULT_PAGE_SIZE,
+                     after: Optional[str] = None, projection: Optional[List[str]] = None) -> Dict:
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True) # Return dicts
     try:
-        cursor.execute("SHOW TABLES LIKE %s", (table_name,))
-        if not cursor.fetchone():
-             raise HTTPException(status_code=404, detail="Table not found")
+        if handle:
+            handle.attach(conn)
+        sql, params, select_cols, pk_columns = prepare_table_scan(conn, table_name, projection, after, limit)
 
-        cursor.execute(f"SELECT * FROM `{table_name}` LIMIT 100")
-        rows = cursor.fetchall()
-        return {"data": rows}
+        with metrics.mysql_statement("data"):
+            cursor.execute(sql, tuple(params))
+            rows = cursor.fetchall()
+        return {
+            "data": rows,
+            "columns": select_cols,
+            "next_cursor": table_browser.next_cursor(rows, pk_columns, limit),
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if handle:
+            handle.detach()
+        conn.close()
+
+def plan_table_stream(table_name: str, projection: Optional[List[str]], after: Optional[str]):
+    conn = get_db_connection()
+    try:
+        sql, params, select_cols, _ = prepare_table_scan(conn, table_name, projection, after, None)
+        return sql, params, select_cols
     finally:
         conn.close()
 
+async def stream_table_data(sql: str, params: List, select_cols: List[str]):
+    # Holds a "data" slot for the whole stream, like the paged path. Batches
+    # come off an unbuffered cursor on the query executor, so MySQL streams
+    # rows and we hold one batch at a time. Rows go through encode_json so
+    # DECIMALs and dates come out as in the JSON pages.
+    loop = asyncio.get_running_loop()
+    handle = QueryHandle()
+    async with endpoint_semaphores["data"]:
+        conn = await loop.run_in_executor(QUERY_EXECUTOR, get_db_connection)
+        completed = False
+        metrics.mysql_in_flight.inc("data_stream")
+        try:
+            handle.attach(conn)
+            cursor = conn.cursor(buffered=False)
+            await loop.run_in_executor(QUERY_EXECUTOR, lambda: cursor.execute(sql, tuple(params)))
+            while True:
+                rows = await loop.run_in_executor(QUERY_EXECUTOR, cursor.fetchmany, table_browser.STREAM_FETCH_SIZE)
+                if not rows:
+                    break
+                yield b"".join(encode_json(dict(zip(select_cols, row))) + b"\n" for row in rows)
+            completed = True
+        finally:
+            metrics.mysql_in_flight.dec("data_stream")
+            if completed:
+                handle.detach()
+                conn.close()
+            else:
+                # Client went away mid-stream: KILL the statement instead of
+                # draining millions of unread rows
+                await loop.run_in_executor(None, kill_query, handle)
+                conn.discard()
+
 @app.get("/api/filter-values/{table_name}/{column_name}")
-def get_filter_values(table_name: str, column_name: str):
+async def get_filter_values(table_name: str, column_name: str, request: Request, prefix: Optional[str] = None,
+                            limit: int = FILTER_VALUES_DEFAULT_LIMIT, order: str = "value"):
+    # order=count returns the top-N values by frequency, ?prefix= narrows the
+    # list for type-ahead on high-cardinality columns (user_uid, product_name)
+    allowed_chars = set("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+    if not set(table_name).issubset(allowed_chars) or not set(column_name).issubset(allowed_chars):
+         raise HTTPException(status_code=400, detail="Invalid table or column name")
+    if order not in ("value", "count"):
+         raise HTTPException(status_code=400, detail="order must be 'value' or 'count'")
+    limit = max(1, min(limit, FILTER_VALUES_MAX_LIMIT))
+
+    version = await run_in_threadpool(get_data_version)
+    cache_key = (table_name, column_name, prefix or "", limit, order, version)
+    etag = make_etag("filter_values", cache_key)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    cached = filter_value_cache.get(cache_key)
+    if cached is not None:
+        return FastJSONResponse(cached, headers=headers)
+
+    handle = QueryHandle()
+    result = await run_cancellable(
+        request, "filter_values",
+        lambda: filter_value_cache.get_or_compute(
+            cache_key, lambda: fetch_filter_values(table_name, column_name, prefix, limit, order, version, handle)
+        ),
+        handle,
+    )
+    return FastJSONResponse(result, headers=headers)
+
+def fetch_filter_values(table_name: str, column_name: str, prefix: Optional[str], limit: int, order: str,
+                        version: int, handle: Optional[QueryHandle] = None) -> Dict:
     conn = get_db_connection()
-    cursor = conn.cursor()
     try:
-        # Basic validation on identifiers
-        sql = f"SELECT DISTINCT `{column_name}` FROM `{table_name}` WHERE `{column_name}` IS NOT NULL AND `{column_name}` != '' ORDER BY `{column_name}`"
-        cursor.execute(sql)
-        values = [row[0] for row in cursor.fetchall()]
-        return {"values": values}
+        if handle:
+            handle.attach(conn)
+        if filter_catalog.catalog_version(conn, table_name, column_name) != version:
+            if not filter_catalog.column_exists(conn, table_name, column_name):
+                raise HTTPException(status_code=404, detail="Column not found")
+            # Not precomputed by the ETL (or stale): build it once for this data version
+            filter_catalog.rebuild_column(conn, table_name, column_name, version)
+        with metrics.mysql_statement("filter_values"):
+            values, counts, truncated = filter_catalog.lookup(conn, table_name, column_name, prefix, limit, order)
+        return {"values": values, "counts": counts, "truncated": truncated}
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching filter values: {e}")
         raise HTTPException(status_code=400, detail=str(e))
     finally:
+        if handle:
+            handle.detach()
         conn.close()
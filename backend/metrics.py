@@ -0,0 +1,179 @@
+import bisect
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# In-process metrics rendered in the Prometheus text format by GET /metrics,
+# plus sampled structured logging of report statements.
+# Everything is per worker process; Prometheus sums across workers.
+
+# Fraction of report statements logged; slow ones are always logged
+QUERY_LOG_SAMPLE_RATE = 0.05
+SLOW_QUERY_LOG_SECONDS = 2.0
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ROW_BUCKETS = (1, 10, 100, 1000, 10_000, 100_000, 1_000_000)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _label_text(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def set(self, *label_values, value: float):
+        # Also used to mirror a count kept elsewhere (cache hit counters)
+        with self._lock:
+            self._values[label_values] = value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_label_text(self.labels, k)} {v}" for k, v in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values, amount: float = 1):
+        self.inc(*label_values, amount=-amount)
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {} # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, *label_values, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = [0] * (len(self.buckets) + 2)
+                self._values[label_values] = entry
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*label_values, value=time.perf_counter() - start)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {entry[-1]}")
+            lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {entry[-2]}")
+            lines.append(f"{self.name}_count{_label_text(self.labels, key)} {entry[-1]}")
+        return lines
+
+_metrics: List = []
+# Callbacks that refresh gauges owned by other modules (caches, pools) at scrape time
+_collectors: List[Callable[[], None]] = []
+
+def _register(metric):
+    _metrics.append(metric)
+    return metric
+
+def add_collector(collect: Callable[[], None]):
+    _collectors.append(collect)
+
+def render() -> str:
+    for collect in _collectors:
+        try:
+            collect()
+        except Exception as e:
+            print(f"Warning: Metrics collector failed: {e}")
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+http_request_seconds = _register(Histogram(
+    "bi_http_request_duration_seconds", "HTTP request latency by endpoint", ("method", "endpoint", "status")))
+report_query_seconds = _register(Histogram(
+    "bi_report_query_duration_seconds", "MySQL time per report statement", ("report_id",)))
+report_rows = _register(Histogram(
+    "bi_report_rows_returned", "Rows returned per report statement", ("report_id",), buckets=ROW_BUCKETS))
+report_errors = _register(Counter(
+    "bi_report_query_errors_total", "Failed report statements", ("report_id",)))
+cache_hits = _register(Counter("bi_cache_hits_total", "Cache hits", ("cache",)))
+cache_misses = _register(Counter("bi_cache_misses_total", "Cache misses", ("cache",)))
+cache_hit_ratio = _register(Gauge("bi_cache_hit_ratio", "Cache hits / lookups since start", ("cache",)))
+pool_wait_seconds = _register(Histogram(
+    "bi_db_pool_wait_seconds", "Time spent waiting for a pooled MySQL connection", ("pool",)))
+pool_in_use = _register(Gauge("bi_db_pool_connections_in_use", "Checked out MySQL connections", ("pool",)))
+mirror_queries = _register(Counter(
+    "bi_mirror_queries_total", "Report statements answered by the columnar mirror, and verification mismatches", ("result",)))
+mysql_in_flight = _register(Gauge("bi_mysql_queries_in_flight", "MySQL statements currently executing", ("endpoint",)))
+
+def observe_cache(name: str, cache):
+    hits, misses = cache.hits, cache.misses
+    cache_hits.set(name, value=hits)
+    cache_misses.set(name, value=misses)
+    cache_hit_ratio.set(name, value=hits / (hits + misses) if hits + misses else 0)
+
+@contextmanager
+def mysql_statement(endpoint: str):
+    mysql_in_flight.inc(endpoint)
+    try:
+        yield
+    finally:
+        mysql_in_flight.dec(endpoint)
+
+def log_query(report_id: str, sql: str, params: List, duration: float, rows: Optional[int], error: Optional[str] = None):
+    # One JSON line per logged statement; slow and failed statements are
+    # always kept, the rest are sampled
+    if error is None and duration < SLOW_QUERY_LOG_SECONDS and random.random() >= QUERY_LOG_SAMPLE_RATE:
+        return
+    print(json.dumps({
+        "event": "report_query",
+        "report_id": report_id,
+        "duration_ms": round(duration * 1000, 1),
+        "rows": rows,
+        "slow": duration >= SLOW_QUERY_LOG_SECONDS,
+        "error": error,
+        "sql": " ".join(sql.split()),
+        "params": params,
+    }, default=str))
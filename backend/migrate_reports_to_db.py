@@ -1,22 +1,13 @@
 import json
-import mysql.connector
 import os
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
+from db import get_db_connection
+from data_version import REPORTS_VERSION_KEY, bump_version
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 REPORTS_FILE = os.path.join(BASE_DIR, "bi_reports.json")
 
 def migrate_reports():
-    conn = mysql.connector.connect(**DB_CONFIG)
+    conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
@@ -66,6 +57,8 @@ def migrate_reports():
             cursor.execute(sql, (r_id, cat, title, desc, config_json))
             
         conn.commit()
+        # Tell running API workers to reload their report registry
+        bump_version(conn, REPORTS_VERSION_KEY)
         print("Migration complete.")
 
     except Exception as e:
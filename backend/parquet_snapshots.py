@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from columnar_mirror import translate_sql
+from data_version import carries_forward
+
+# Point-in-time Parquet snapshots of the fact and user/plan tables.
+# ETL scripts write one after loading (write_snapshot), stamped with the data
+# version, under snapshots/v<version>/<table>/app_key=../region_key=../month=../
+# Tables an ETL run didn't touch are hard-linked from the snapshot of the
+# version right before it, if there is one.
+# The API answers long-range report queries (and queries pinned to an older
+# snapshot_version) from them with DuckDB, reading only the partitions the
+# time range and app_key / region_key filters can match.
+# Needs pyarrow to write and duckdb to query; both optional.
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+# table -> datetime column the month partition comes from (None: no month partition)
+SNAPSHOT_TABLES = {
+    'Fact_Order': 'pay_time',
+    'Fact_Subscription': 'first_start_time',
+    'Dim_User': 'join_date',
+    'Dim_Plan': None,
+}
+PARTITION_COLUMNS = ('app_key', 'region_key')
+NULL_PARTITION = "__null__"
+EMPTY_PARTITION = "__empty__"
+FETCH_BATCH_SIZE = 50_000
+SNAPSHOTS_KEPT = 14
+MANIFEST_FILE = "manifest.json"
+
+def snapshots_writable() -> bool:
+    return pyarrow is not None
+
+def snapshots_queryable() -> bool:
+    return duckdb is not None
+
+def _arrow_type(data_type: str, precision, scale):
+    data_type = data_type.lower()
+    if data_type in ("tinyint", "smallint", "mediumint", "int", "integer", "bigint", "year"):
+        return pyarrow.int64()
+    if data_type in ("decimal", "numeric"):
+        if precision and int(precision) <= 38:
+            return pyarrow.decimal128(int(precision), int(scale or 0))
+        return pyarrow.float64()
+    if data_type in ("float", "double", "real"):
+        return pyarrow.float64()
+    if data_type in ("datetime", "timestamp"):
+        return pyarrow.timestamp("us")
+    if data_type == "date":
+        return pyarrow.date32()
+    return pyarrow.string()
+
+def _partition_value(value) -> str:
+    if value is None:
+        return NULL_PARTITION
+    return EMPTY_PARTITION if value == "" else quote(str(value), safe="")
+
+def snapshot_path(version: int) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"v{int(version)}")
+
+def snapshot_versions() -> List[int]:
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return []
+    versions = []
+    for name in os.listdir(SNAPSHOT_DIR):
+        if re.fullmatch(r"v\d+", name) and os.path.exists(os.path.join(SNAPSHOT_DIR, name, MANIFEST_FILE)):
+            versions.append(int(name[1:]))
+    return sorted(versions)
+
+@lru_cache(maxsize=32)
+def _read_manifest(version: int) -> Dict:
+    # Raises (so nothing is cached) while the snapshot isn't there
+    with open(os.path.join(snapshot_path(version), MANIFEST_FILE)) as f:
+        return json.load(f)
+
+def load_manifest(version: int) -> Optional[Dict]:
+    # Snapshots never change once written, so found manifests are cached. The
+    # existence check drops versions another process has pruned since.
+    if not os.path.exists(os.path.join(snapshot_path(version), MANIFEST_FILE)):
+        return None
+    try:
+        return _read_manifest(version)
+    except FileNotFoundError:
+        return None
+
+def clear_manifest_cache():
+    _read_manifest.cache_clear()
+
+def _write_table(conn, root: str, table_name: str, time_column: Optional[str]) -> List[Dict]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COLUMN_NAME, DATA_TYPE, NUMERIC_PRECISION, NUMERIC_SCALE FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (table_name,))
+        columns = cursor.fetchall()
+    finally:
+        cursor.close()
+    names = [c[0] for c in columns]
+    schema = pyarrow.schema([(name, _arrow_type(t, p, s)) for name, t, p, s in columns])
+
+    partition_columns = [c for c in PARTITION_COLUMNS if c in names]
+    partition_exprs = [f"`{c}`" for c in partition_columns]
+    if time_column and time_column in names:
+        partition_exprs.append(f"DATE_FORMAT(`{time_column}`, '%Y%m')")
+    else:
+        time_column = None
+
+    # Sorted by partition so only one file is open at a time; the sort happens
+    # in MySQL and rows are streamed with an unbuffered cursor
+    select_list = ", ".join([f"`{n}`" for n in names] + partition_exprs)
+    sql = f"SELECT {select_list} FROM `{table_name}`"
+    if partition_exprs:
+        sql += " ORDER BY " + ", ".join(partition_exprs)
+
+    files = []
+    # Keys the collation sorts as equal ('a' / 'A', trailing spaces) can come
+    # back after another key, so a partition directory may get several files
+    written: Dict[str, int] = {}
+    writer, current, current_file = None, None, None
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute(sql)
+        while True:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            if not rows:
+                break
+            start = 0
+            while start < len(rows):
+                key = rows[start][len(names):]
+                end = start
+                while end < len(rows) and rows[end][len(names):] == key:
+                    end += 1
+                if key != current:
+                    if writer is not None:
+                        writer.close()
+                    parts = [f"{c}={_partition_value(v)}" for c, v in zip(partition_columns, key)]
+                    if time_column:
+                        parts.append(f"month={_partition_value(key[-1])}")
+                    rel_dir = os.path.join(table_name, *parts)
+                    written[rel_dir] = written.get(rel_dir, -1) + 1
+                    rel_path = os.path.join(rel_dir, f"part-{written[rel_dir]}.parquet")
+                    os.makedirs(os.path.dirname(os.path.join(root, rel_path)), exist_ok=True)
+                    writer = pyarrow.parquet.ParquetWriter(os.path.join(root, rel_path), schema, compression="zstd")
+                    current = key
+                    current_file = {"path": rel_path, "rows": 0}
+                    current_file.update({c: (None if v is None else str(v)) for c, v in zip(partition_columns, key)})
+                    if time_column:
+                        current_file["month"] = key[-1]
+                    files.append(current_file)
+                chunk = rows[start:end]
+                writer.write_table(pyarrow.table({
+                    name: [v.decode(errors="replace") if isinstance(v, bytes) else v for v in values]
+                    for name, values in zip(names, zip(*chunk))
+                }, schema=schema))
+                current_file["rows"] += len(chunk)
+                start = end
+    finally:
+        cursor.close()
+        if writer is not None:
+            writer.close()
+
+    if not files:
+        # Empty table: one empty file so queries still see its columns
+        rel_path = os.path.join(table_name, "part-0.parquet")
+        os.makedirs(os.path.join(root, table_name), exist_ok=True)
+        pyarrow.parquet.write_table(schema.empty_table(), os.path.join(root, rel_path))
+        files.append({"path": rel_path, "rows": 0, "empty": True})
+    return files
+
+def _link_tree(source: str, target: str):
+    for dirpath, _, filenames in os.walk(source):
+        target_dir = os.path.join(target, os.path.relpath(dirpath, source))
+        os.makedirs(target_dir, exist_ok=True)
+        for filename in filenames:
+            try:
+                os.link(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+            except OSError:
+                shutil.copy2(os.path.join(dirpath, filename), os.path.join(target_dir, filename))
+
+def write_snapshot(conn, version: int, tables: Optional[List[str]] = None):
+    # Snapshot for data version `version`. Only `tables` are read from MySQL,
+    # the others are carried over from the previous version's snapshot. An
+    # older snapshot may have missed UPDATE scripts, so without one every
+    # table is read again.
+    if pyarrow is None:
+        return
+    start_ts = time.time()
+    root = snapshot_path(version)
+    if os.path.exists(os.path.join(root, MANIFEST_FILE)):
+        return
+    tmp_root = f"{root}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_root, ignore_errors=True)
+    os.makedirs(tmp_root)
+
+    previous_versions = [v for v in snapshot_versions() if v < version]
+    previous = load_manifest(previous_versions[-1]) if previous_versions else None
+    if previous and not carries_forward(previous.get("data_version"), version):
+        previous = None
+    manifest = {"data_version": version, "created_at": datetime.now().isoformat(timespec="seconds"), "tables": {}}
+    try:
+        for table_name, time_column in SNAPSHOT_TABLES.items():
+            if tables is not None and table_name not in tables and previous and table_name in previous["tables"]:
+                _link_tree(os.path.join(snapshot_path(previous_versions[-1]), table_name), os.path.join(tmp_root, table_name))
+                manifest["tables"][table_name] = previous["tables"][table_name]
+                continue
+            files = _write_table(conn, tmp_root, table_name, time_column)
+            manifest["tables"][table_name] = {"time_column": time_column, "files": files}
+        with open(os.path.join(tmp_root, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+    except Exception:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+        raise
+    os.replace(tmp_root, root)
+
+    for old in snapshot_versions()[:-SNAPSHOTS_KEPT]:
+        shutil.rmtree(snapshot_path(old), ignore_errors=True)
+    clear_manifest_cache()
+    print(f"Parquet snapshot v{version} written in {time.time() - start_ts:.2f}s")
+
+def _matches(file: Dict, column: str, allowed: Optional[set]) -> bool:
+    if allowed is None or column not in file:
+        return True
+    return file[column] is not None and file[column] in allowed
+
+def prune_files(manifest: Dict, table_name: str, filters: Dict, months: Optional[Tuple[str, str]]) -> List[str]:
+    # Files of table_name whose partition values can match the filters and the
+    # (first, last) month of the time range
+    files = manifest["tables"][table_name]["files"]
+    allowed = {}
+    for column in PARTITION_COLUMNS:
+        value = (filters or {}).get(column)
+        if value:
+            allowed[column] = {str(v) for v in value} if isinstance(value, list) else {str(value)}
+    kept = []
+    for file in files:
+        if file.get("empty"):
+            continue
+        if not all(_matches(file, c, allowed.get(c)) for c in PARTITION_COLUMNS):
+            continue
+        if months and "month" in file:
+            month = file["month"]
+            if month is None or (months[0] and month < months[0]) or (months[1] and month > months[1]):
+                continue
+        kept.append(file["path"])
+    return kept
+
+def _month_of(bound: Optional[str]) -> Optional[str]:
+    return bound[:4] + bound[5:7] if bound else None
+
+def snapshot_sql(sql: str, version: int, source_table: str, filters: Dict, time_range: Optional[tuple]) -> Optional[str]:
+    # Report SQL as DuckDB over the snapshot's Parquet files, or None if the
+    # snapshot can't answer it
+    manifest = load_manifest(version)
+    if manifest is None:
+        return None
+    duck_sql = translate_sql(sql, set(manifest["tables"]))
+    if duck_sql is None:
+        return None
+    root = snapshot_path(version)
+
+    months = None
+    if time_range:
+        column, start, end = time_range
+        time_column = manifest["tables"].get(source_table, {}).get("time_column")
+        if time_column and column == f"`{source_table}`.`{time_column}`":
+            # The end month may be one too many for an exclusive bound; the WHERE drops those rows
+            months = (_month_of(start), _month_of(end))
+
+    def scan(m):
+        keyword, table_name = m.group(1), m.group(2)
+        if table_name == source_table:
+            paths = prune_files(manifest, table_name, filters, months)
+        else:
+            paths = prune_files(manifest, table_name, {}, None)
+        if not paths:
+            # Nothing can match: an empty relation with the right columns
+            empty = manifest["tables"][table_name]["files"][0]["path"]
+            return f"{keyword} (SELECT * FROM read_parquet('{_quote_path(root, empty)}') LIMIT 0) AS \"{table_name}\""
+        listing = ", ".join(f"'{_quote_path(root, p)}'" for p in paths)
+        return f"{keyword} read_parquet([{listing}]) AS \"{table_name}\""
+
+    return re.sub(r"\b(FROM|JOIN)\s+\"(\w+)\"", scan, duck_sql, flags=re.IGNORECASE)
+
+def _quote_path(root: str, rel_path: str) -> str:
+    return os.path.join(root, rel_path).replace("'", "''")
+
+def execute_snapshot_query(sql: str, params: List) -> Tuple[List[str], List[tuple]]:
+    conn = duckdb.connect()
+    try:
+        cursor = conn.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        return columns, cursor.fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,134 @@
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# Period-over-period comparison of date bucketed reports.
+# Both periods are whole buckets: the current one runs from the bucket holding
+# start to the one holding the last instant before end, so a partial first or
+# last bucket never mixes in days of the other period. "previous" compares with
+# as many buckets right before it (whatever their length), "year" with the same
+# buckets a year earlier; Feb 29 has no counterpart and compares with nothing.
+# When the two periods touch or overlap they are read with one query over
+# both, otherwise with one query each so the gap between them isn't scanned.
+
+COMPARE_LABELS = {"previous": "previous period", "year": "last year"}
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+BUCKET_STARTS = {
+    '%Y-%m-%d': dict(hour=0, minute=0, second=0, microsecond=0),
+    '%Y-%m': dict(day=1, hour=0, minute=0, second=0, microsecond=0),
+    '%Y': dict(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+}
+
+def shift_years(value: datetime, years: int) -> Optional[datetime]:
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:
+        # Feb 29 has no counterpart
+        return None
+
+def next_bucket(value: datetime, fmt: str, step: int = 1) -> datetime:
+    if fmt == '%Y-%m-%d':
+        return value + timedelta(days=step)
+    if fmt == '%Y-%m':
+        months = value.year * 12 + value.month - 1 + step
+        return value.replace(year=months // 12, month=months % 12 + 1)
+    return value.replace(year=value.year + step)
+
+def bucket_labels(start: datetime, end: datetime, fmt: str) -> List[datetime]:
+    # Bucket starts from the one holding start up to (not including) end
+    buckets = []
+    current = start.replace(**BUCKET_STARTS[fmt])
+    while current < end:
+        buckets.append(current)
+        current = next_bucket(current, fmt)
+    return buckets
+
+def plan_periods(start: datetime, end: datetime, fmt: str, mode: str) -> Optional[Dict]:
+    # Bucket labels of both periods (comparison[i] pairs with current[i], None
+    # when it has no counterpart), the comparison range and the half-open
+    # ranges to query; None when start..end holds no bucket
+    current = bucket_labels(start, end, fmt)
+    if not current:
+        return None
+    current_end = next_bucket(current[-1], fmt)
+    if mode == "year":
+        comparison = [shift_years(b, -1) for b in current]
+    else:
+        comparison = [next_bucket(current[0], fmt, i - len(current)) for i in range(len(current))]
+
+    ranges = [(current[0], current_end)]
+    matched = [b for b in comparison if b]
+    compare_range = (matched[0], next_bucket(matched[-1], fmt)) if matched else (None, None)
+    if matched:
+        if compare_range[1] >= current[0]:
+            ranges = [(min(compare_range[0], current[0]), current_end)]
+        else:
+            ranges.insert(0, compare_range)
+
+    def fmt_time(value: Optional[datetime]) -> Optional[str]:
+        return value.strftime(TIME_FORMAT) if value else None
+
+    return {
+        "current": [b.strftime(fmt) for b in current],
+        "comparison": [b.strftime(fmt) if b else None for b in comparison],
+        "range": {
+            "start": fmt_time(compare_range[0]),
+            "end": fmt_time(compare_range[1]),
+            "current_start": fmt_time(current[0]),
+            "current_end": fmt_time(current_end),
+        },
+        "ranges": [(fmt_time(s), fmt_time(e)) for s, e in ranges],
+    }
+
+def merge_period_results(results: List[Dict]) -> Dict:
+    # Results of consecutive ranges as one, matching series by name (split
+    # series can differ between the periods)
+    if len(results) == 1:
+        return results[0]
+    names = []
+    for result in results:
+        names.extend(s["name"] for s in result["series"] if s["name"] not in names)
+    series = []
+    for name in names:
+        data, first = [], None
+        for result in results:
+            match = next((s for s in result["series"] if s["name"] == name), None)
+            data.extend(match["data"] if match else [0] * len(result["x_axis"]))
+            first = first or match
+        series.append({**{k: v for k, v in first.items() if k not in ("data", "error")}, "data": data})
+    return {
+        **{k: v for k, v in results[-1].items() if k not in ("x_axis", "series")},
+        "x_axis": [x for result in results for x in result["x_axis"]],
+        "series": series,
+    }
+
+def align_compare(result: Dict, plan: Dict, mode: str) -> Dict:
+    # Result covering both periods -> current series, comparison series and deltas per bucket
+    positions = {str(x): i for i, x in enumerate(result["x_axis"]) if x is not None}
+    current_idx = [positions.get(label) for label in plan["current"]]
+    compare_idx = [positions.get(label) if label else None for label in plan["comparison"]]
+    suffix = COMPARE_LABELS[mode]
+
+    series = []
+    for s in result["series"]:
+        data = s["data"]
+        current = [data[i] if i is not None else 0 for i in current_idx]
+        previous = [data[i] if i is not None else 0 for i in compare_idx]
+        series.append({
+            **{k: v for k, v in s.items() if k not in ("data", "error")},
+            "data": current,
+            "delta": [c - p for c, p in zip(current, previous)],
+            "delta_pct": [(c - p) / abs(p) if p else None for c, p in zip(current, previous)],
+        })
+        series.append({
+            **{k: v for k, v in s.items() if k not in ("data", "error")},
+            "name": f"{s['name']} ({suffix})",
+            "data": previous,
+            "comparison": True,
+        })
+    return {
+        **{k: v for k, v in result.items() if k not in ("x_axis", "series")},
+        "x_axis": plan["current"],
+        "series": series,
+        "compare": {"mode": mode, **plan["range"]},
+    }
@@ -1,18 +1,9 @@
-import mysql.connector
 from datetime import date, timedelta
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
+from data_version import bump_data_version
+from db import get_db_connection
 
 def populate_dim_time():
-    conn = mysql.connector.connect(**DB_CONFIG)
+    conn = get_db_connection()
     cursor = conn.cursor()
 
     try:
@@ -58,6 +49,7 @@ def populate_dim_time():
              conn.commit()
              
         print("Done.")
+        bump_data_version(conn)
 
     except Exception as e:
         print(f"Error: {e}")
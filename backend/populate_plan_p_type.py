@@ -1,18 +1,7 @@
-import mysql.connector
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from rollups import refresh_rollups
+from db import get_db_connection
 
 def populate_plan_types():
     conn = get_db_connection()
@@ -75,6 +64,8 @@ def populate_plan_types():
                 print(f"  Updated {total_updated} rows...")
             
             print(f"Update Complete. Time: {time.time() - start_ts:.2f}s")
+            refresh_rollups(conn)
+            bump_data_version(conn)
         else:
             print("No known plan types identified.")
 
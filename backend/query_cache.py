@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# In-process result cache for /api/query.
+# - Bounded LRU with a per-entry TTL
+# - Single-flight: concurrent requests for the same key share one execution
+
+def normalize_filters(filters: Dict[str, Any]) -> str:
+    # Empty values are ignored by execute_query, so drop them here too.
+    # Lists are order-insensitive (they become IN (...) clauses).
+    normalized = {}
+    for col, val in (filters or {}).items():
+        if not val:
+            continue
+        if isinstance(val, list):
+            normalized[col] = sorted(str(v) for v in val)
+        else:
+            normalized[col] = str(val)
+    return json.dumps(normalized, sort_keys=True)
+
+def make_cache_key(report_id: str, config_hash: str, filters: Dict[str, Any], granularity: str, data_version: int,
+                   time_range: Optional[tuple] = None, variant: str = "", split: Optional[tuple] = None,
+                   compare: Optional[str] = None) -> tuple:
+    # variant tells apart answers of different precision ("sample", "exact");
+    # split is (column, limit) for results pivoted by a slice; compare the
+    # period-over-period mode
+    return (report_id, config_hash, normalize_filters(filters), granularity or "", data_version, time_range, variant,
+            split, compare)
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class ResultCache:
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict() # key -> (expires_at, value)
+        self._inflight: Dict[Hashable, _InFlight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+            return value
+
+    def _get_locked(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + (ttl_seconds or self.ttl_seconds), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any], ttl_seconds: Optional[float] = None) -> Any:
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _InFlight()
+                self._inflight[key] = flight
+
+        if not leader:
+            # Someone else is already running this exact query, wait for it
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+            self.put(key, flight.result, ttl_seconds)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    def items(self) -> list:
+        now = time.monotonic()
+        with self._lock:
+            return [(k, v) for k, (expires_at, v) in self._entries.items() if expires_at >= now]
+
+    def invalidate_report(self, report_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == report_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
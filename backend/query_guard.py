@@ -0,0 +1,86 @@
+import re
+from typing import Dict, List, Optional
+
+from query_cache import ResultCache
+
+# Guard stage for report SQL built from report configs.
+# Every compiled statement is EXPLAINed (plans are cached per SQL shape),
+# full table scans over a row-estimate threshold are warned about or rejected,
+# and each statement gets a MAX_EXECUTION_TIME hint for its report class.
+
+# "warn" logs offending statements, "reject" refuses to run them, "off" skips EXPLAIN
+GUARD_MODE = "warn"
+# Full scans estimated above this many rows are considered too expensive
+FULL_SCAN_ROW_LIMIT = 5_000_000
+
+# Report class (report.category) -> MAX_EXECUTION_TIME in milliseconds
+EXECUTION_TIME_LIMITS_MS = {
+    'default': 30_000,
+    'finance': 60_000,
+    'user': 60_000,
+    'device': 30_000,
+}
+
+PLAN_CACHE_TTL_SECONDS = 3600
+plan_cache = ResultCache(max_entries=1024, ttl_seconds=PLAN_CACHE_TTL_SECONDS)
+
+class QueryRejected(Exception):
+    def __init__(self, message: str, analysis: Dict):
+        super().__init__(message)
+        self.analysis = analysis
+
+def sql_shape(sql: str) -> str:
+    # Statements that differ only in the length of an IN list share a plan
+    shape = re.sub(r"IN \((?:%s, )*%s\)", "IN (...)", sql)
+    return re.sub(r"\s+", " ", shape).strip()
+
+def execution_time_limit(report) -> int:
+    return EXECUTION_TIME_LIMITS_MS.get(getattr(report, "category", None) or "default", EXECUTION_TIME_LIMITS_MS['default'])
+
+def add_execution_hint(sql: str, limit_ms: int) -> str:
+    # Optimizer hint must directly follow the outermost SELECT keyword
+    return re.sub(r"^\s*SELECT\b", f"SELECT /*+ MAX_EXECUTION_TIME({int(limit_ms)}) */", sql, count=1, flags=re.IGNORECASE)
+
+def explain(conn, sql: str, params: List) -> List[Dict]:
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("EXPLAIN " + sql, tuple(params))
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+def analyze_plan(plan: List[Dict]) -> Dict:
+    estimated_rows = 0
+    full_scans = []
+    indexes_used = []
+    for row in plan:
+        rows = int(row.get("rows") or 0)
+        estimated_rows = max(estimated_rows, rows)
+        access = (row.get("type") or "").upper()
+        if access in ("ALL", "INDEX"):
+            full_scans.append({"table": row.get("table"), "rows": rows, "type": access})
+        if row.get("key"):
+            indexes_used.append({"table": row.get("table"), "index": row.get("key")})
+
+    warnings = [
+        f"Full scan of {scan['table']} (~{scan['rows']} rows)"
+        for scan in full_scans if scan["rows"] > FULL_SCAN_ROW_LIMIT
+    ]
+    return {
+        "estimated_rows": estimated_rows,
+        "full_scans": full_scans,
+        "indexes_used": indexes_used,
+        "warnings": warnings,
+        "plan": plan,
+    }
+
+def check_query(conn, sql: str, params: List, report_id: Optional[str] = None) -> Optional[Dict]:
+    if GUARD_MODE == "off":
+        return None
+    analysis = plan_cache.get_or_compute(sql_shape(sql), lambda: analyze_plan(explain(conn, sql, params)))
+    if analysis["warnings"]:
+        message = f"Report {report_id}: " + "; ".join(analysis["warnings"])
+        if GUARD_MODE == "reject":
+            raise QueryRejected(message, analysis)
+        print(f"Query guard warning: {message}")
+    return analysis
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+from fastapi import HTTPException, Request
+
+from db import get_db_connection
+
+# Async execution path for heavy MySQL endpoints.
+# - Blocking mysql.connector work runs on a dedicated executor, so slow reports
+#   never starve Starlette's default threadpool (reports list, schema, ...)
+# - Each endpoint has its own concurrency limit
+# - When the browser goes away, the running statement is stopped with KILL QUERY
+
+QUERY_WORKERS = 12
+ENDPOINT_CONCURRENCY = {
+    'query': 8,
+    'data': 2,
+    'filter_values': 2,
+}
+# How often we check whether the client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="bi-query")
+endpoint_semaphores = {name: asyncio.Semaphore(limit) for name, limit in ENDPOINT_CONCURRENCY.items()}
+
+class QueryCancelled(Exception):
+    pass
+
+class QueryHandle:
+    # Tracks the MySQL connection running a statement so it can be killed.
+    # One handle can be shared by several requests waiting on the same result.
+    def __init__(self):
+        self.connection_id: Optional[int] = None
+        self.cancelled = False
+        self.waiters = 0
+
+    def attach(self, conn):
+        if self.cancelled:
+            raise QueryCancelled("Query cancelled before execution")
+        self.connection_id = conn.connection_id
+
+    def detach(self):
+        self.connection_id = None
+
+_shared_handles: Dict[Hashable, QueryHandle] = {}
+_shared_lock = threading.Lock()
+
+def acquire_shared_handle(key: Hashable) -> QueryHandle:
+    with _shared_lock:
+        handle = _shared_handles.get(key)
+        if handle is None:
+            handle = QueryHandle()
+            _shared_handles[key] = handle
+        handle.waiters += 1
+        return handle
+
+def release_shared_handle(key: Hashable, handle: QueryHandle) -> bool:
+    # Returns True when nobody else is waiting on this handle any more
+    with _shared_lock:
+        handle.waiters -= 1
+        if handle.waiters > 0:
+            return False
+        if _shared_handles.get(key) is handle:
+            del _shared_handles[key]
+        return True
+
+def kill_query(handle: QueryHandle):
+    handle.cancelled = True
+    connection_id = handle.connection_id
+    if connection_id is None:
+        return
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"KILL QUERY {int(connection_id)}")
+        print(f"Killed abandoned query on connection {connection_id}")
+    except Exception as e:
+        # The statement may have finished in the meantime
+        print(f"Warning: KILL QUERY {connection_id} failed: {e}")
+    finally:
+        conn.close()
+
+async def run_cancellable(request: Request, endpoint: str, fn: Callable, handle: QueryHandle,
+                          release: Optional[Callable[[], bool]] = None):
+    # Run fn() on the query executor under the endpoint's semaphore.
+    # release() decides whether this caller was the last one interested in
+    # the statement (shared handles); by default the handle is ours alone.
+    loop = asyncio.get_running_loop()
+    task = None
+    try:
+        async with endpoint_semaphores[endpoint]:
+            task = loop.run_in_executor(QUERY_EXECUTOR, fn)
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+                if done:
+                    return task.result()
+                if await request.is_disconnected():
+                    raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        last = release() if release else True
+        if last and task is not None and not task.done():
+            await loop.run_in_executor(None, kill_query, handle)
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from data_version import REPORTS_VERSION_KEY, read_version, bump_version
+
+# In-memory registry of saved reports, indexed by id.
+# Loaded once from bi_reports and reloaded only when the reports_version
+# counter in system_metadata moves (another worker saved/deleted a report).
+
+class RegisteredReport:
+    def __init__(self, raw: Dict, config: Any):
+        self.raw = raw
+        self.config = config
+        # Stable hash of the config, used in cache keys so an edited report
+        # never serves results computed from its old definition
+        self.config_hash = hashlib.sha1(json.dumps(raw, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+class ReportRegistry:
+    def __init__(self, connect: Callable, parse: Callable[[Dict], Any], poll_seconds: float = 2.0):
+        self._connect = connect
+        self._parse = parse
+        self.poll_seconds = poll_seconds
+        self._reports: Dict[str, RegisteredReport] = {}
+        self._order: List[str] = []
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, conn, version: int):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT config FROM bi_reports")
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        reports = {}
+        order = []
+        for row in rows:
+            raw = json.loads(row[0])
+            try:
+                reports[raw["id"]] = RegisteredReport(raw, self._parse(raw))
+            except Exception as e:
+                # Keep a broken report listed (the editor must be able to fix it)
+                print(f"Warning: Invalid report config {raw.get('id')}: {e}")
+                reports[raw["id"]] = RegisteredReport(raw, None)
+            order.append(raw["id"])
+
+        self._reports = reports
+        self._order = order
+        self._version = version
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.poll_seconds:
+            return
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.poll_seconds:
+                return
+            conn = self._connect()
+            try:
+                version = read_version(conn, REPORTS_VERSION_KEY)
+                if version != self._version:
+                    self._load(conn, version)
+                self._checked_at = time.monotonic()
+            finally:
+                conn.close()
+
+    @property
+    def version(self) -> Optional[int]:
+        self._ensure_fresh()
+        return self._version
+
+    def get(self, report_id: str) -> Optional[RegisteredReport]:
+        self._ensure_fresh()
+        return self._reports.get(report_id)
+
+    def all(self) -> List[RegisteredReport]:
+        self._ensure_fresh()
+        reports = self._reports
+        return [reports[r_id] for r_id in self._order if r_id in reports]
+
+    def mark_changed(self, conn):
+        # Called after a write to bi_reports; reload now and notify other workers
+        with self._lock:
+            version = bump_version(conn, REPORTS_VERSION_KEY)
+            self._load(conn, version)
+            self._checked_at = time.monotonic()
@@ -0,0 +1,86 @@
+import hashlib
+import json
+from decimal import Decimal
+from typing import Any, Dict, List
+
+from fastapi.responses import Response
+
+# Response encoding for query results.
+# JSON goes through orjson when it is installed (stdlib json otherwise), and
+# /api/query can answer with an Arrow IPC stream (format=arrow or an Accept
+# header asking for it) when pyarrow is installed.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def encode_json(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+def make_etag(*parts) -> str:
+    # Strong validator over whatever determines the payload (data version,
+    # report config hash, request parameters)
+    return '"' + hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        # Weak comparison, as If-None-Match requires
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+def numeric_column(values) -> List[float]:
+    # One pass over a result column; NULL measures plot as 0
+    if None in values:
+        return [float(v) if v is not None else 0 for v in values]
+    return list(map(float, values))
+
+def arrow_available() -> bool:
+    return pyarrow is not None
+
+def wants_arrow(format: str, accept: str) -> bool:
+    return format == "arrow" or ARROW_MEDIA_TYPE in (accept or "")
+
+def encode_arrow(result: Dict) -> bytes:
+    # One record batch: x_result as strings plus a float64 column per series
+    arrays = [pyarrow.array([None if x is None else str(x) for x in result["x_axis"]], type=pyarrow.string())]
+    names = ["x_result"]
+    for series in result["series"]:
+        arrays.append(pyarrow.array(series["data"], type=pyarrow.float64()))
+        names.append(series["name"])
+    batch = pyarrow.RecordBatch.from_arrays(arrays, names=names)
+
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
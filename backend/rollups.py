@@ -0,0 +1,249 @@
+import json
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from data_version import ensure_metadata_table
+
+# Pre-aggregated daily rollups of the fact tables.
+# execute_query answers a report from the rollup when its measures, group-by
+# and filters can be expressed on it, and falls back to the base table otherwise.
+# Run this file directly (or call refresh_rollups) after loading fact data.
+
+ROLLUP_STATE_KEY = "rollup_state"
+
+ROLLUPS = {
+    'Fact_Order': {
+        'table': 'Agg_Order_Daily',
+        'date_column': 'pay_time',
+        'dimensions': ['app_key', 'region_key', 'plan_key', 'plan_p_type'],
+        # rollup column -> expression over the base table
+        'aggregates': {
+            'row_count': 'COUNT(*)',
+            'sum_cny_amount': 'SUM(cny_amount)',
+            'sum_amount': 'SUM(amount)',
+        },
+    },
+    'Fact_Subscription': {
+        'table': 'Agg_Subscription_Daily',
+        'date_column': 'first_start_time',
+        # Fact_Subscription has no plan_p_type column of its own
+        'dimensions': ['app_key', 'region_key', 'plan_key'],
+        'aggregates': {
+            'row_count': 'COUNT(*)',
+        },
+    },
+}
+
+# Report measure (normalized) -> how to re-aggregate it from rollup columns
+MEASURE_REWRITES = {
+    'COUNT(*)': 'SUM(row_count)',
+    'COUNT(1)': 'SUM(row_count)',
+    'SUM(cny_amount)': 'SUM(sum_cny_amount)',
+    'SUM(amount)': 'SUM(sum_amount)',
+}
+
+DATE_BUCKET_FORMATS = ("%Y", "%Y-%m", "%Y-%m-%d")
+
+def _strip_table_prefix(expr: str, table: str) -> str:
+    return re.sub(rf"`?{table}`?\.", "", expr)
+
+def _normalize_expr(expr: str, table: str) -> str:
+    expr = _strip_table_prefix(expr, table).replace("`", "")
+    expr = re.sub(r"\s+", "", expr)
+    m = re.match(r"^([A-Za-z_]+)\((.*)\)$", expr)
+    if m:
+        expr = f"{m.group(1).upper()}({m.group(2)})"
+    return expr
+
+def split_top_level(expr: str, sep: str = ",") -> List[str]:
+    # Split on separators that are not inside parentheses or quotes
+    parts, depth, quote, current = [], 0, None, []
+    for ch in expr:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == sep and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+def split_alias(term: str) -> Tuple[str, Optional[str]]:
+    m = re.match(r"^(.*?)\s+as\s+(['\"`]?)(.+?)\2\s*$", term, flags=re.IGNORECASE | re.DOTALL)
+    if m:
+        return m.group(1).strip(), m.group(3)
+    return term.strip(), None
+
+def rewrite_measures(measure_formula: str, table: str) -> Optional[str]:
+    rewritten = []
+    for term in split_top_level(measure_formula or ""):
+        expr, alias = split_alias(term)
+        target = MEASURE_REWRITES.get(_normalize_expr(expr, table))
+        if not target:
+            return None
+        # Keep the column name MySQL would have produced for the base query,
+        # since series names come from the result columns
+        name = alias if alias is not None else expr
+        rewritten.append(f"{target} AS `{name.replace('`', '')}`")
+    return ", ".join(rewritten) if rewritten else None
+
+def rewrite_group_expression(group_expression: str, table: str, spec: Dict) -> Optional[str]:
+    expr = _strip_table_prefix(group_expression.strip(), table).replace("`", "")
+    if expr in spec['dimensions']:
+        return f"`{expr}`"
+    m = re.match(r"^DATE_FORMAT\(\s*(\w+)\s*,\s*'([^']+)'\s*\)$", expr, flags=re.IGNORECASE)
+    if m and m.group(1) == spec['date_column'] and m.group(2) in DATE_BUCKET_FORMATS:
+        return f"DATE_FORMAT(`day`, '{m.group(2)}')"
+    return None
+
+def rewrite_time_range(time_range: Optional[tuple], table: str, spec: Dict):
+    # The rollup is daily, so only whole-day bounds on its date column fit
+    if not time_range:
+        return [], []
+    column, start, end = time_range
+    if _strip_table_prefix(column, table).replace("`", "") != spec['date_column']:
+        return None
+    clauses, params = [], []
+    for bound, op in ((start, ">="), (end, "<")):
+        if not bound:
+            continue
+        if not bound.endswith("00:00:00"):
+            return None
+        clauses.append(f"`day` {op} %s")
+        params.append(bound[:10])
+    return clauses, params
+
+def build_rollup_sql(report, group_expression: str, filters: Dict, time_range: Optional[tuple] = None,
+                     split_by: Optional[str] = None) -> Optional[Tuple[str, List]]:
+    # Returns (sql, params) against the rollup table, or None if the report
+    # can't be answered from it
+    spec = ROLLUPS.get(report.source_table)
+    if not spec or report.joins or report.base_where:
+        return None
+
+    measures = rewrite_measures(report.measure_formula, report.source_table)
+    group_sql = rewrite_group_expression(group_expression, report.source_table, spec)
+    if not measures or not group_sql:
+        return None
+    if split_by and split_by not in spec['dimensions']:
+        return None
+
+    params = []
+    where_clauses = []
+    for col, val in filters.items():
+        if not val:
+            continue
+        if col not in spec['dimensions']:
+            return None
+        if isinstance(val, list):
+            placeholders = ', '.join(['%s'] * len(val))
+            where_clauses.append(f"`{col}` IN ({placeholders})")
+            params.extend(val)
+        else:
+            where_clauses.append(f"`{col}` = %s")
+            params.append(val)
+
+    time_clauses = rewrite_time_range(time_range, report.source_table, spec)
+    if time_clauses is None:
+        return None
+    where_clauses.extend(time_clauses[0])
+    params.extend(time_clauses[1])
+
+    # Same split_value column the base query emits, pivoted by build_series
+    split_select = f"`{split_by}` as split_value, " if split_by else ""
+    sql = f"SELECT {group_sql} as x_result, {split_select}{measures} FROM `{spec['table']}`"
+    if where_clauses:
+        sql += " WHERE " + " AND ".join(where_clauses)
+    sql += " GROUP BY x_result" + (", split_value" if split_by else "") + " ORDER BY x_result"
+    return sql, params
+
+def _create_rollup_table(cursor, spec: Dict):
+    dim_cols = ", ".join(f"`{d}` VARCHAR(255)" for d in spec['dimensions'])
+    agg_cols = ", ".join(
+        f"`{name}` BIGINT" if name == 'row_count' else f"`{name}` DECIMAL(30,4)"
+        for name in spec['aggregates']
+    )
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS `{spec['table']}` (
+            `day` DATE,
+            {dim_cols},
+            {agg_cols},
+            KEY idx_day (`day`),
+            KEY idx_app_region_day (`app_key`, `region_key`, `day`)
+        )
+    """)
+
+def refresh_rollups(conn):
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        for fact_table, spec in ROLLUPS.items():
+            start_ts = time.time()
+            _create_rollup_table(cursor, spec)
+
+            dims = ", ".join(f"`{d}`" for d in spec['dimensions'])
+            aggs = ", ".join(spec['aggregates'].values())
+            agg_names = ", ".join(f"`{a}`" for a in spec['aggregates'])
+
+            # Rebuild inside one transaction so readers never see a half-filled rollup
+            cursor.execute(f"DELETE FROM `{spec['table']}`")
+            cursor.execute(f"""
+                INSERT INTO `{spec['table']}` (`day`, {dims}, {agg_names})
+                SELECT DATE(`{spec['date_column']}`), {dims}, {aggs}
+                FROM `{fact_table}`
+                GROUP BY DATE(`{spec['date_column']}`), {dims}
+            """)
+            print(f"Rollup {spec['table']} rebuilt: {cursor.rowcount} rows in {time.time() - start_ts:.2f}s")
+
+        cursor.execute(
+            "REPLACE INTO system_metadata (`key`, value) VALUES (%s, %s)",
+            (ROLLUP_STATE_KEY, json.dumps({"ready": True, "refreshed_at": int(time.time())}))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def mark_rollups_stale(conn):
+    # After a load whose rollup rebuild failed: stop answering from them until the next refresh
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        cursor.execute(
+            "REPLACE INTO system_metadata (`key`, value) VALUES (%s, %s)",
+            (ROLLUP_STATE_KEY, json.dumps({"ready": False, "refreshed_at": int(time.time())}))
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+
+def rollups_ready(conn) -> bool:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s", (ROLLUP_STATE_KEY,))
+        row = cursor.fetchone()
+        return bool(row and json.loads(row[0]).get("ready"))
+    finally:
+        cursor.close()
+
+if __name__ == "__main__":
+    from db import get_db_connection
+    from data_version import bump_data_version
+
+    conn = get_db_connection()
+    try:
+        refresh_rollups(conn)
+        bump_data_version(conn)
+    finally:
+        conn.close()
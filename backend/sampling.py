@@ -0,0 +1,171 @@
+import json
+import math
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+
+from data_version import carries_forward, ensure_metadata_table
+from rollups import split_alias, split_top_level
+
+# Deterministic 1% samples of the big tables for approximate previews.
+# A row is in the sample when CRC32(key) falls in the first SAMPLE_PERCENT of
+# 100 buckets, so the same rows are picked on every rebuild. /api/query with
+# sample=true runs the report on the side table instead, scales SUM / COUNT
+# measures by 1 / rate and returns a 95% error bar for each of them.
+# Samples are stamped with the data version they were built at and only used
+# while it is current, so loads and UPDATE scripts that don't rebuild them fall
+# back to exact queries. Call refresh_samples after bumping the data version.
+
+SAMPLE_STATE_KEY = "sample_state"
+SAMPLE_PERCENT = 1
+# z for a two-sided 95% interval
+CONFIDENCE_Z = 1.96
+
+SAMPLES = {
+    'Fact_Order': {'table': 'Fact_Order_Sample', 'key': 'order_uuid'},
+    'Fact_Subscription': {'table': 'Fact_Subscription_Sample', 'key': 'subscription_key'},
+    'Dim_User': {'table': 'Dim_User_Sample', 'key': 'uid'},
+}
+
+def sample_rate() -> float:
+    return SAMPLE_PERCENT / 100
+
+def _stored_columns(cursor, table_name: str) -> List[str]:
+    # Generated columns (date keys) can't be inserted into
+    cursor.execute("""
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND EXTRA NOT LIKE '%GENERATED%'
+        ORDER BY ORDINAL_POSITION
+    """, (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+def read_sample_state(conn) -> Dict:
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT value FROM system_metadata WHERE `key` = %s", (SAMPLE_STATE_KEY,))
+        row = cursor.fetchone()
+        return json.loads(row[0]) if row else {}
+    finally:
+        cursor.close()
+
+def refresh_samples(conn, version: int, tables: Optional[List[str]] = None):
+    # Rebuilds the samples of `tables` (all when None) for data version
+    # `version`; the other samples are kept only if they were current right
+    # before this load
+    cursor = conn.cursor()
+    try:
+        ensure_metadata_table(cursor)
+        state = read_sample_state(conn)
+        built = set()
+        if tables is not None and state.get("percent") == SAMPLE_PERCENT and carries_forward(state.get("version"), version):
+            built = set(state.get("tables", []))
+        else:
+            tables = None
+        for base_table, spec in SAMPLES.items():
+            if tables is not None and base_table not in tables:
+                continue
+            start_ts = time.time()
+            # LIKE keeps the base table's indexes and generated columns
+            cursor.execute(f"CREATE TABLE IF NOT EXISTS `{spec['table']}` LIKE `{base_table}`")
+            columns = ", ".join(f"`{c}`" for c in _stored_columns(cursor, spec['table']))
+            cursor.execute(f"DELETE FROM `{spec['table']}`")
+            cursor.execute(f"""
+                INSERT INTO `{spec['table']}` ({columns})
+                SELECT {columns} FROM `{base_table}`
+                WHERE MOD(CRC32(`{spec['key']}`), 100) < %s
+            """, (SAMPLE_PERCENT,))
+            built.add(base_table)
+            print(f"Sample {spec['table']} rebuilt: {cursor.rowcount} rows in {time.time() - start_ts:.2f}s")
+
+        cursor.execute(
+            "REPLACE INTO system_metadata (`key`, value) VALUES (%s, %s)",
+            (SAMPLE_STATE_KEY, json.dumps({
+                "version": version, "tables": sorted(built), "percent": SAMPLE_PERCENT, "refreshed_at": int(time.time())
+            }))
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+def sample_tables(conn, version: int) -> List[str]:
+    # Base tables with a sample built for data version `version` at the current SAMPLE_PERCENT
+    state = read_sample_state(conn)
+    if state.get("percent") != SAMPLE_PERCENT or state.get("version") != version:
+        return []
+    return state.get("tables", [])
+
+def _single_call(expr: str, name: str) -> Optional[str]:
+    # Argument of expr when it is exactly one NAME(...) call
+    m = re.match(rf"^{name}\s*\((.*)\)$", expr.strip(), flags=re.IGNORECASE | re.DOTALL)
+    if not m:
+        return None
+    depth = 0
+    for ch in m.group(1):
+        depth += {"(": 1, ")": -1}.get(ch, 0)
+        if depth < 0:
+            return None
+    return m.group(1) if depth == 0 else None
+
+def plan_sample_measures(measure_formula: str) -> Tuple[str, List[Tuple[str, str, Optional[str]]]]:
+    # Select list for the sampled statement plus, per original measure,
+    # (series name, value alias, sum-of-squares alias or None if not additive)
+    terms = []
+    outputs = []
+    for idx, term in enumerate(split_top_level(measure_formula or "")):
+        expr, alias = split_alias(term)
+        name = alias if alias is not None else expr
+        value_alias = f"s{idx}"
+        terms.append(f"{expr} AS `{value_alias}`")
+
+        sq_alias = None
+        count_arg = _single_call(expr, "COUNT")
+        sum_arg = _single_call(expr, "SUM")
+        if count_arg is not None and not count_arg.strip().upper().startswith("DISTINCT"):
+            # Indicator variable: its square sums to the count itself
+            sq_alias = value_alias
+        elif sum_arg is not None and not sum_arg.strip().upper().startswith("DISTINCT"):
+            sq_alias = f"q{idx}"
+            terms.append(f"SUM(POW({sum_arg}, 2)) AS `{sq_alias}`")
+        outputs.append((name, value_alias, sq_alias))
+    return ", ".join(terms), outputs
+
+def sample_source(sql: str, base_table: str) -> str:
+    # Read the sample table under the base table's name so qualified columns still resolve
+    return sql.replace(f"FROM `{base_table}`", f"FROM `{SAMPLES[base_table]['table']}` AS `{base_table}`", 1)
+
+def scale_sample_result(result: Dict, outputs: List[Tuple[str, str, Optional[str]]]) -> Dict:
+    # Horvitz-Thompson estimate of each additive measure with its Bernoulli
+    # sampling variance (1 - p) / p^2 * sum(y^2); other measures are returned as measured
+    rate = sample_rate()
+    columns = {s["name"]: s["data"] for s in result["series"]}
+    series = []
+    for name, value_alias, sq_alias in outputs:
+        values = columns[value_alias]
+        if sq_alias is None:
+            series.append({"name": name, "data": values, "scaled": False, "error": None})
+            continue
+        squares = columns[sq_alias]
+        series.append({
+            "name": name,
+            "data": [v / rate for v in values],
+            "scaled": True,
+            "error": [CONFIDENCE_Z * math.sqrt(max(q, 0) * (1 - rate)) / rate for q in squares],
+        })
+    return {
+        "x_axis": result["x_axis"],
+        "series": series,
+        "sample": {"percent": SAMPLE_PERCENT, "confidence": 0.95},
+    }
+
+if __name__ == "__main__":
+    from data_version import read_data_version
+    from db import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        refresh_samples(conn, read_data_version(conn))
+    finally:
+        conn.close()
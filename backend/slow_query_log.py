@@ -0,0 +1,138 @@
+import hashlib
+import json
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Statements slower than SLOW_QUERY_THRESHOLD_MS are written to bi_query_log
+# together with rows examined and the EXPLAIN output taken right after they ran.
+# GET /api/debug/slow-queries aggregates the log by SQL fingerprint.
+
+SLOW_QUERY_THRESHOLD_MS = 1000
+LOG_TABLE = "bi_query_log"
+
+def ensure_log_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOG_TABLE} (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            endpoint VARCHAR(64) NOT NULL,
+            report_id VARCHAR(255),
+            fingerprint CHAR(16) NOT NULL,
+            sql_text MEDIUMTEXT NOT NULL,
+            params TEXT,
+            duration_ms DOUBLE NOT NULL,
+            rows_sent BIGINT,
+            rows_examined BIGINT,
+            explain_json MEDIUMTEXT,
+            KEY idx_fingerprint (fingerprint, created_at),
+            KEY idx_created_at (created_at)
+        )
+    """)
+
+def fingerprint(sql: str) -> str:
+    # Same statement with different literals, IN list lengths or hints
+    shape = re.sub(r"/\*\+.*?\*/", "", sql)
+    shape = re.sub(r"'(?:[^'\\]|\\.)*'", "?", shape)
+    shape = re.sub(r"\b\d+(\.\d+)?\b", "?", shape)
+    shape = re.sub(r"IN \((?:(?:%s|\?), )*(?:%s|\?)\)", "IN (...)", shape)
+    shape = re.sub(r"\s+", " ", shape).strip()
+    return hashlib.sha1(shape.encode()).hexdigest()[:16]
+
+def _rows_examined(cursor) -> Optional[int]:
+    # Last completed statement of this session; needs performance_schema
+    try:
+        cursor.execute("""
+            SELECT ROWS_EXAMINED FROM performance_schema.events_statements_history
+            WHERE THREAD_ID = (SELECT THREAD_ID FROM performance_schema.threads WHERE PROCESSLIST_ID = CONNECTION_ID())
+            ORDER BY EVENT_ID DESC LIMIT 1
+        """)
+        row = cursor.fetchone()
+        return int(row[0]) if row and row[0] is not None else None
+    except Exception:
+        return None
+
+def _explain(cursor, sql: str, params: List) -> Optional[List[Dict]]:
+    try:
+        cursor.execute("EXPLAIN " + sql, tuple(params or ()))
+        columns = [col[0] for col in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    except Exception as e:
+        return [{"error": str(e)}]
+
+def record_if_slow(conn, endpoint: str, sql: str, params: Optional[List], duration: float,
+                   rows_sent: Optional[int] = None, report_id: Optional[str] = None):
+    # Call right after the statement finished, on the connection that ran it
+    duration_ms = duration * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS:
+        return
+    cursor = conn.cursor()
+    try:
+        rows_examined = _rows_examined(cursor)
+        plan = _explain(cursor, sql, params)
+        ensure_log_table(cursor)
+        cursor.execute(f"""
+            INSERT INTO {LOG_TABLE}
+                (endpoint, report_id, fingerprint, sql_text, params, duration_ms, rows_sent, rows_examined, explain_json)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (
+            endpoint, report_id, fingerprint(sql), sql, json.dumps(params or [], default=str),
+            round(duration_ms, 1), rows_sent, rows_examined, json.dumps(plan, default=str),
+        ))
+        conn.commit()
+    except Exception as e:
+        print(f"Warning: Failed to record slow query: {e}")
+    finally:
+        cursor.close()
+
+@contextmanager
+def timed_statement(conn, endpoint: str, sql: str, params: Optional[List] = None, report_id: Optional[str] = None):
+    # For statements whose row count isn't interesting (ETL INSERT ... SELECT)
+    start_ts = time.perf_counter()
+    yield
+    record_if_slow(conn, endpoint, sql, params, time.perf_counter() - start_ts, report_id=report_id)
+
+def slow_query_summary(conn, since_hours: int, limit: int) -> List[Dict]:
+    cursor = conn.cursor(dictionary=True)
+    try:
+        ensure_log_table(cursor)
+        cursor.execute(f"""
+            SELECT fingerprint,
+                   COUNT(*) AS executions,
+                   ROUND(SUM(duration_ms), 1) AS total_ms,
+                   ROUND(AVG(duration_ms), 1) AS avg_ms,
+                   MAX(duration_ms) AS max_ms,
+                   MAX(rows_examined) AS max_rows_examined,
+                   GROUP_CONCAT(DISTINCT endpoint) AS endpoints,
+                   GROUP_CONCAT(DISTINCT report_id) AS report_ids,
+                   MAX(created_at) AS last_seen,
+                   MAX(id) AS latest_id
+            FROM {LOG_TABLE}
+            WHERE created_at >= NOW() - INTERVAL %s HOUR
+            GROUP BY fingerprint
+            ORDER BY total_ms DESC
+            LIMIT {int(limit)}
+        """, (int(since_hours),))
+        groups = cursor.fetchall()
+        if not groups:
+            return []
+
+        # Latest statement of each group as the example, with its plan
+        ids = [g["latest_id"] for g in groups]
+        cursor.execute(
+            f"SELECT id, sql_text, params, explain_json FROM {LOG_TABLE} WHERE id IN ({', '.join(['%s'] * len(ids))})",
+            tuple(ids)
+        )
+        samples = {row["id"]: row for row in cursor.fetchall()}
+    finally:
+        cursor.close()
+
+    for group in groups:
+        sample = samples.get(group.pop("latest_id"), {})
+        group["endpoints"] = group["endpoints"].split(",") if group["endpoints"] else []
+        group["report_ids"] = group["report_ids"].split(",") if group["report_ids"] else []
+        group["sample_sql"] = sample.get("sql_text")
+        group["sample_params"] = json.loads(sample["params"]) if sample.get("params") else []
+        group["explain"] = json.loads(sample["explain_json"]) if sample.get("explain_json") else None
+    return groups
@@ -0,0 +1,90 @@
+import base64
+import json
+from typing import Dict, List, Optional
+
+# Keyset-paginated access to raw tables for /api/data/{table}.
+# Pages are addressed by an opaque cursor holding the last primary key seen,
+# so every page is an index range scan no matter how deep the analyst scrolls.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+STREAM_FETCH_SIZE = 1000
+
+class TableBrowseError(ValueError):
+    pass
+
+def encode_cursor(values: List) -> str:
+    raw = json.dumps(values, default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> List:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise TableBrowseError("Invalid cursor")
+    if not isinstance(values, list):
+        raise TableBrowseError("Invalid cursor")
+    return values
+
+def describe_table(conn, table_name: str):
+    # (columns in table order, primary key columns in index order)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (table_name,))
+        columns = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = 'PRIMARY'
+            ORDER BY SEQ_IN_INDEX
+        """, (table_name,))
+        pk_columns = [row[0] for row in cursor.fetchall()]
+        return columns, pk_columns
+    finally:
+        cursor.close()
+
+def build_page_sql(table_name: str, columns: List[str], pk_columns: List[str],
+                   projection: Optional[List[str]], after: Optional[str], limit: Optional[int]):
+    if projection:
+        unknown = [c for c in projection if c not in columns]
+        if unknown:
+            raise TableBrowseError(f"Unknown columns: {', '.join(unknown)}")
+        # Key columns are always selected, the next cursor is built from them
+        select_cols = pk_columns + [c for c in projection if c not in pk_columns]
+    else:
+        select_cols = columns
+
+    sql = f"SELECT {', '.join(f'`{c}`' for c in select_cols)} FROM `{table_name}`"
+    params = []
+
+    if after:
+        if not pk_columns:
+            raise TableBrowseError("Table has no primary key, cursor paging is not available")
+        values = decode_cursor(after)
+        if len(values) != len(pk_columns):
+            raise TableBrowseError("Invalid cursor")
+        key_list = ", ".join(f"`{c}`" for c in pk_columns)
+        placeholders = ", ".join(["%s"] * len(pk_columns))
+        sql += f" WHERE ({key_list}) > ({placeholders})"
+        params.extend(values)
+
+    if pk_columns:
+        sql += " ORDER BY " + ", ".join(f"`{c}`" for c in pk_columns)
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params, select_cols
+
+def next_cursor(rows: List[Dict], pk_columns: List[str], limit: int) -> Optional[str]:
+    if not pk_columns or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor([last[c] for c in pk_columns])
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+from period_compare import align_compare, merge_period_results, plan_periods
+
+def test_previous_snaps_unaligned_start_to_whole_buckets():
+    plan = plan_periods(datetime(2025, 3, 15), datetime(2025, 5, 10), "%Y-%m", "previous")
+    assert plan["current"] == ["2025-03", "2025-04", "2025-05"]
+    assert plan["comparison"] == ["2024-12", "2025-01", "2025-02"]
+    # The comparison ends where the first current bucket starts, so no March day is counted twice
+    assert plan["range"]["start"] == "2024-12-01 00:00:00"
+    assert plan["range"]["end"] == "2025-03-01 00:00:00"
+    assert plan["ranges"] == [("2024-12-01 00:00:00", "2025-06-01 00:00:00")]
+
+def test_previous_months_of_different_length_line_up_by_bucket():
+    plan = plan_periods(datetime(2025, 3, 1), datetime(2025, 4, 1), "%Y-%m", "previous")
+    assert plan["comparison"] == ["2025-02"]
+    assert plan["range"]["start"] == "2025-02-01 00:00:00"
+
+    days = plan_periods(datetime(2025, 3, 1), datetime(2025, 4, 1), "%Y-%m-%d", "previous")
+    assert len(days["current"]) == 31
+    assert days["comparison"][0] == "2025-01-29"
+    assert days["comparison"][-1] == "2025-02-28"
+
+def test_year_skips_the_gap_between_periods():
+    plan = plan_periods(datetime(2025, 3, 10), datetime(2025, 3, 12), "%Y-%m-%d", "year")
+    assert plan["comparison"] == ["2024-03-10", "2024-03-11"]
+    assert plan["ranges"] == [
+        ("2024-03-10 00:00:00", "2024-03-12 00:00:00"),
+        ("2025-03-10 00:00:00", "2025-03-12 00:00:00"),
+    ]
+
+def test_year_over_a_full_year_uses_one_query():
+    plan = plan_periods(datetime(2025, 1, 1), datetime(2026, 1, 1), "%Y-%m", "year")
+    assert plan["comparison"][0] == "2024-01"
+    assert plan["ranges"] == [("2024-01-01 00:00:00", "2026-01-01 00:00:00")]
+
+def test_year_feb_29_has_no_counterpart():
+    plan = plan_periods(datetime(2024, 2, 28), datetime(2024, 3, 2), "%Y-%m-%d", "year")
+    assert plan["current"] == ["2024-02-28", "2024-02-29", "2024-03-01"]
+    assert plan["comparison"] == ["2023-02-28", None, "2023-03-01"]
+
+    only = plan_periods(datetime(2024, 2, 29), datetime(2024, 3, 1), "%Y-%m-%d", "year")
+    assert only["comparison"] == [None]
+    assert only["range"]["start"] is None
+    assert only["ranges"] == [("2024-02-29 00:00:00", "2024-03-01 00:00:00")]
+
+def test_empty_range_has_no_plan():
+    assert plan_periods(datetime(2025, 3, 1), datetime(2025, 3, 1), "%Y-%m-%d", "previous") is None
+
+def test_align_compare_pairs_buckets_by_label():
+    plan = plan_periods(datetime(2024, 2, 28), datetime(2024, 3, 2), "%Y-%m-%d", "year")
+    results = [
+        {"x_axis": ["2023-02-28", "2023-03-01"], "series": [{"name": "orders", "data": [4, 5]}]},
+        {"x_axis": ["2024-02-28", "2024-02-29", "2024-03-01"], "series": [{"name": "orders", "data": [8, 7, 5]}]},
+    ]
+    aligned = align_compare(merge_period_results(results), plan, "year")
+    assert aligned["x_axis"] == ["2024-02-28", "2024-02-29", "2024-03-01"]
+    current, previous = aligned["series"]
+    assert current["data"] == [8, 7, 5]
+    assert previous["name"] == "orders (last year)"
+    assert previous["data"] == [4, 0, 5]
+    assert current["delta"] == [4, 7, 0]
+    assert current["delta_pct"] == [1.0, None, 0.0]
+
+def test_merge_matches_series_by_name():
+    merged = merge_period_results([
+        {"x_axis": ["2024-01"], "series": [{"name": "a", "data": [1]}, {"name": "b", "data": [2]}]},
+        {"x_axis": ["2025-01"], "series": [{"name": "b", "data": [3]}, {"name": "c", "data": [4]}], "approximate": True},
+    ])
+    assert merged["x_axis"] == ["2024-01", "2025-01"]
+    assert [(s["name"], s["data"]) for s in merged["series"]] == [("a", [1, 0]), ("b", [2, 3]), ("c", [0, 4])]
+    assert merged["approximate"] is True
@@ -1,18 +1,7 @@
-import mysql.connector
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from rollups import refresh_rollups
+from db import get_db_connection
 
 def update_order_plan_info():
     conn = get_db_connection()
@@ -91,6 +80,8 @@ def update_order_plan_info():
         
         conn.commit()
         end_ts = time.time()
+        refresh_rollups(conn)
+        bump_data_version(conn)
         
         print(f"Update Complete. Processed {updates_executed} distinct plans covering the orders.")
         print(f"Time taken: {end_ts - start_ts:.2f} seconds")
@@ -1,19 +1,7 @@
-import mysql.connector
 from datetime import datetime
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from db import get_db_connection
 
 def update_paytimes():
     conn = get_db_connection()
@@ -74,6 +62,7 @@ def update_paytimes():
             updated_count += len(batch_data)
             
         end_ts = time.time()
+        bump_data_version(conn)
         print(f"Update Complete. Total subscriptions updated: {updated_count}")
         print(f"Time taken: {end_ts - start_ts:.2f} seconds")
 
@@ -1,19 +1,8 @@
 import mysql.connector
 from datetime import datetime
 import time
-
-# MySQL Configuration
-DB_CONFIG = {
-    'user': 'root',
-    'password': 'ne@202509',
-    'host': 'localhost',
-    'port': 3306,
-    'database': 'bi_data',
-    'auth_plugin': 'mysql_native_password'
-}
-
-def get_db_connection():
-    return mysql.connector.connect(**DB_CONFIG)
+from data_version import bump_data_version
+from db import get_db_connection
 
 def get_source_table(app, region):
     if not app or not region:
@@ -104,6 +93,7 @@ def update_user_times(target_table="Dim_User"):
                 continue
 
         end_time = time.time()
+        bump_data_version(conn)
         print("\n" + "="*50)
         print(f"ALL DONE for {target_table}. Total Updated: {total_updates} users.")
         print(f"Time Taken: {end_time - start_time:.2f}s")
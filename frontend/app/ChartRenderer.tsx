@@ -6,49 +6,79 @@ import {
 } from 'recharts';
 import { Loader2, AlertCircle } from "lucide-react";
 
+// Last response per query body, revalidated with If-None-Match (POST isn't HTTP-cached)
+const queryResponseCache = new Map<string, { etag: string; json: any }>();
+
 interface ChartRendererProps {
     report: any;
     apiBase: string;
     filters: any;
+    splitBy?: string; // Slice to compare: one line per value from a single query
+    compare?: string; // "previous" or "year": adds the comparison period as extra lines
+    // Set by a parent that fetched this chart in a batch (null while it loads); skips the chart's own request
+    prefetched?: { result?: any; error?: string } | null;
 }
 
-export default function ChartRenderer({ report, apiBase, filters }: ChartRendererProps) {
+// Transform for Recharts: { x_axis: [...], series: [{data: [...]}] }
+// Needs array of objects: [{ name: 'Jan', value: 100 }, ...]
+const toChartData = (json: any) => json.x_axis.map((xVal: any, idx: number) => {
+    const item: any = { name: xVal, Total: 0 };
+    json.series.forEach((s: any) => {
+        const val = s.data[idx] || 0;
+        item[s.name || "Value"] = val;
+        if (!s.comparison) item.Total += val;
+    });
+    return item;
+});
+
+export default function ChartRenderer({ report, apiBase, filters, splitBy, compare, prefetched }: ChartRendererProps) {
     const [data, setData] = useState<any[] | null>(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
 
     useEffect(() => {
+        if (prefetched !== undefined) return;
         fetchData();
-    }, [report.id, report.config, apiBase, JSON.stringify(filters)]);
+    }, [prefetched === undefined, report.id, report.config, apiBase, JSON.stringify(filters), splitBy, compare]);
+
+    useEffect(() => {
+        if (prefetched === undefined) return;
+        setLoading(prefetched === null);
+        setError(prefetched?.error ?? null);
+        setData(prefetched?.result ? toChartData(prefetched.result) : null);
+    }, [prefetched]);
 
     const fetchData = async () => {
         setLoading(true);
         setError(null);
         try {
+            const body = JSON.stringify({
+                report_id: report.id,
+                filters: filters,
+                ...(splitBy ? { split_by: splitBy } : {}),
+                ...(compare ? { compare } : {})
+            });
+            const cacheKey = `${apiBase}|${body}`;
+            const cachedResponse = queryResponseCache.get(cacheKey);
+            const headers: Record<string, string> = { "Content-Type": "application/json" };
+            if (cachedResponse) headers["If-None-Match"] = cachedResponse.etag;
+
             const res = await fetch(`${apiBase}/query`, {
                 method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    report_id: report.id,
-                    filters: filters
-                })
-            });
-            const json = await res.json();
-            if (!res.ok) throw new Error(json.detail || "Query failed");
-
-            // Transform for Recharts: { x_axis: [...], series: [{data: [...]}] }
-            // Needs array of objects: [{ name: 'Jan', value: 100 }, ...]
-            const chartData = json.x_axis.map((xVal: any, idx: number) => {
-                const item: any = { name: xVal, Total: 0 };
-                json.series.forEach((s: any) => {
-                    const val = s.data[idx] || 0;
-                    item[s.name || "Value"] = val;
-                    item.Total += val;
-                });
-                return item;
+                headers,
+                body
             });
-
-            setData(chartData);
+            let json: any;
+            if (res.status === 304 && cachedResponse) {
+                json = cachedResponse.json;
+            } else {
+                json = await res.json();
+                if (!res.ok) throw new Error(json.detail || "Query failed");
+                const etag = res.headers.get("ETag");
+                if (etag) queryResponseCache.set(cacheKey, { etag, json });
+            }
+
+            setData(toChartData(json));
 
         } catch (err: any) {
             console.error("Chart fetch error:", err);
@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { TrendingUp, Users, Smartphone, Plus, Edit2, Trash2, LayoutDashboard, Copy } from "lucide-react";
 import ReportEditor from "./ReportEditor";
 import ChartRenderer from "./ChartRenderer";
@@ -18,6 +18,9 @@ const CATEGORY_NAMES: any = {
     device: "设备与使用 (Device & Usage)"
 };
 
+// Batch answer without an entry for a report (kept constant so the chart doesn't re-render for it)
+const MISSING_RESULT = { error: "No result returned" };
+
 export default function DashboardViewer() {
     const [reports, setReports] = useState<any[]>([]);
     const [tables, setTables] = useState<any[]>([]); // For editor
@@ -29,6 +32,14 @@ export default function DashboardViewer() {
     // Filter State
     const [filters, setFilters] = useState<any>({});
     const [filterOptions, setFilterOptions] = useState<any>({});
+    const [splitBy, setSplitBy] = useState("");
+    const [compare, setCompare] = useState("");
+
+    // Chart results by report id from one streamed /query/batch request; a chart
+    // without an entry is still loading until the stream ends
+    const [chartResults, setChartResults] = useState<Record<string, { result?: any; error?: string }>>({});
+    const [batchDone, setBatchDone] = useState(false);
+    const batchSeq = useRef(0);
 
     // Dynamic API Base for LAN access
     const [apiBase, setApiBase] = useState("http://localhost:8000/api");
@@ -53,6 +64,66 @@ export default function DashboardViewer() {
         }
     }, [reports]);
 
+    useEffect(() => {
+        if (reports.length > 0) {
+            fetchChartResults();
+        }
+    }, [reports, apiBase, JSON.stringify(filters), splitBy, compare]);
+
+    const fetchChartResults = async () => {
+        // Every chart in one round trip, each rendered as soon as its NDJSON
+        // line arrives; a newer request wins over a slower older one
+        const seq = ++batchSeq.current;
+        setChartResults({});
+        setBatchDone(false);
+        const queries = reports.map((report: any) => ({
+            report_id: report.id,
+            filters: filters,
+            ...(report.slices?.includes(splitBy) ? { split_by: splitBy } : {}),
+            ...(compare ? { compare } : {})
+        }));
+        const receive = (item: any) => {
+            if (seq !== batchSeq.current) return;
+            setChartResults(prev => ({
+                ...prev,
+                [item.key]: item.error !== undefined ? { error: String(item.error) } : { result: item.result }
+            }));
+        };
+        try {
+            const res = await fetch(`${API_BASE}/query/batch`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ queries, stream: true })
+            });
+            if (!res.ok || !res.body) {
+                const json = await res.json().catch(() => ({}));
+                throw new Error(json.detail || "Query failed");
+            }
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = "";
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffered += decoder.decode(value, { stream: true });
+                const lines = buffered.split("\n");
+                buffered = lines.pop() || "";
+                lines.filter(line => line.trim()).forEach(line => receive(JSON.parse(line)));
+            }
+            if (buffered.trim()) receive(JSON.parse(buffered));
+        } catch (err: any) {
+            console.error("Dashboard batch fetch error:", err);
+            if (seq === batchSeq.current) {
+                setChartResults(prev => {
+                    const next = { ...prev };
+                    reports.forEach((report: any) => { next[report.id] = next[report.id] || { error: err.message }; });
+                    return next;
+                });
+            }
+        }
+        if (seq === batchSeq.current) setBatchDone(true);
+    };
+
     const fetchFilterOptions = async () => {
         const report = reports[0]; // Assuming single report mode as requested
         if (!report || !report.slices) return;
@@ -188,6 +259,33 @@ export default function DashboardViewer() {
                             </select>
                         </div>
                     ))}
+                    {reports[0]?.slices?.length > 0 && (
+                        <div className="flex flex-col">
+                            <label className="text-[10px] font-bold text-gray-400 uppercase tracking-widest mb-1 ml-1">compare by</label>
+                            <select
+                                className="bg-gray-50 border border-gray-200 rounded-lg px-3 py-2 text-sm focus:ring-2 focus:ring-indigo-500 outline-none min-w-[120px]"
+                                onChange={(e) => setSplitBy(e.target.value)}
+                                value={splitBy}
+                            >
+                                <option value="">None</option>
+                                {reports[0].slices.map((slice: string) => (
+                                    <option key={slice} value={slice}>{slice.replace('_key', '')}</option>
+                                ))}
+                            </select>
+                        </div>
+                    )}
+                    <div className="flex flex-col">
+                        <label className="text-[10px] font-bold text-gray-400 uppercase tracking-widest mb-1 ml-1">versus</label>
+                        <select
+                            className="bg-gray-50 border border-gray-200 rounded-lg px-3 py-2 text-sm focus:ring-2 focus:ring-indigo-500 outline-none min-w-[120px]"
+                            onChange={(e) => setCompare(e.target.value)}
+                            value={compare}
+                        >
+                            <option value="">None</option>
+                            <option value="previous">Previous period (MoM)</option>
+                            <option value="year">Last year (YoY)</option>
+                        </select>
+                    </div>
                 </div>
             </div>
 
@@ -208,7 +306,10 @@ export default function DashboardViewer() {
 
                         {/* Chart Rendering - Full Width & Height */}
                         <div className={`w-full ${report.chart_type === 'matrix' ? 'h-[900px]' : 'h-[500px]'}`}>
-                            <ChartRenderer report={report} apiBase={API_BASE} filters={filters} />
+                            <ChartRenderer report={report} apiBase={API_BASE} filters={filters}
+                                splitBy={report.slices?.includes(splitBy) ? splitBy : undefined}
+                                compare={compare || undefined}
+                                prefetched={chartResults[report.id] ?? (batchDone ? MISSING_RESULT : null)} />
                         </div>
                     </div>
                 ))}
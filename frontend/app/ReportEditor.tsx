@@ -1,7 +1,7 @@
 "use client";
 
 import React, { useState, useEffect } from "react";
-import { X, Save, Database, Sigma } from "lucide-react";
+import { X, Save, Database, Sigma, Eye } from "lucide-react";
 
 interface ReportEditorProps {
     report?: any;
@@ -69,16 +69,43 @@ export default function ReportEditor({ report, onSave, onCancel, tables }: Repor
         }
     }, [formData.source_table, tables]);
 
+    const [preview, setPreview] = useState<any>(null);
+    const [previewError, setPreviewError] = useState("");
+    const [previewing, setPreviewing] = useState(false);
+
+    // Construct standard report object
+    const buildReport = () => ({
+        ...formData,
+        // Construct necessary internal fields for backend compatibility
+        measures: [{ column: "calculated", label: "Value" }], // simplified
+        x_axis: { column: formData.group_by, label: formData.group_by, type: "category", granularity_options: [] },
+        filters: []
+    });
+
+    // Approximate numbers from the 1% sample tables; the exact query only runs once saved
+    const handlePreview = async () => {
+        setPreviewing(true);
+        setPreviewError("");
+        try {
+            const res = await fetch(`${apiBase}/reports/dry-run`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ report: buildReport(), sample: true })
+            });
+            const data = await res.json();
+            if (!res.ok) throw new Error(data.detail || "Preview failed");
+            setPreview(data.preview);
+            if (!data.preview) setPreviewError("No sample available for this table yet.");
+        } catch (e: any) {
+            setPreview(null);
+            setPreviewError(e.message);
+        } finally {
+            setPreviewing(false);
+        }
+    };
+
     const handleSubmit = () => {
-        // Construct standard report object
-        const newReport = {
-            ...formData,
-            // Construct necessary internal fields for backend compatibility
-            measures: [{ column: "calculated", label: "Value" }], // simplified
-            x_axis: { column: formData.group_by, label: formData.group_by, type: "category", granularity_options: [] },
-            filters: []
-        };
-        onSave(newReport);
+        onSave(buildReport());
     };
 
     return (
@@ -183,6 +210,44 @@ export default function ReportEditor({ report, onSave, onCancel, tables }: Repor
                             <p className="text-[10px] text-gray-400 mt-1">SQL Aggregation syntax allowed.</p>
                         </div>
 
+                        {/* Sampled Preview */}
+                        <div>
+                            <button
+                                onClick={handlePreview}
+                                disabled={previewing || !formData.source_table || !formData.group_by || !formData.measure_formula}
+                                className="text-xs text-indigo-600 hover:text-indigo-800 font-medium flex items-center disabled:text-gray-300"
+                            >
+                                <Eye size={14} className="mr-1" />
+                                {previewing ? "Running..." : "预览 (Preview on 1% sample)"}
+                            </button>
+                            {previewError && <p className="text-xs text-red-500 mt-1">{previewError}</p>}
+                            {preview && (
+                                <div className="mt-2 max-h-40 overflow-y-auto border border-gray-100 rounded">
+                                    <table className="w-full text-xs">
+                                        <thead className="bg-gray-50 text-gray-500">
+                                            <tr>
+                                                <th className="text-left p-1">x</th>
+                                                {preview.series.map((s: any) => <th key={s.name} className="text-right p-1">{s.name}</th>)}
+                                            </tr>
+                                        </thead>
+                                        <tbody>
+                                            {preview.x_axis.map((x: any, i: number) => (
+                                                <tr key={i} className="border-t border-gray-50">
+                                                    <td className="p-1">{String(x)}</td>
+                                                    {preview.series.map((s: any) => (
+                                                        <td key={s.name} className="text-right p-1 font-mono">
+                                                            {Math.round(s.data[i]).toLocaleString()}
+                                                            {s.error && <span className="text-gray-400"> ± {Math.round(s.error[i]).toLocaleString()}</span>}
+                                                        </td>
+                                                    ))}
+                                                </tr>
+                                            ))}
+                                        </tbody>
+                                    </table>
+                                </div>
+                            )}
+                        </div>
+
                         <div className="h-px bg-gray-100 my-2"></div>
 
                         {/* Joins Configuration */}